@@ -1,4 +1,5 @@
 import json
+import os
 import sys
 import time
 import numpy as np
@@ -6,82 +7,152 @@ import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import urllib2
 from mpl_toolkits.mplot3d import Axes3D
-
-def get_json_data(userid):
-    """ Reads json data from url determined from userId. """
-
-    data_file = urllib2.urlopen("https://27bcct7nyg.execute-api.us-east-1.amazonaws.com/Test/userid/%s" % userid)
-    data = json.load(data_file)
-    if data[u'Count'] == 0:
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "prototypes"))
+import se3
+from pose_history import PoseHistory
+from path_store import PathStore, decode_items, phone_name
+from path_download import API_URL
+from dynamodb_stream import read_run
+
+def get_json_data(userid, index=1):
+    """ Reads the items of a run of userId from the url determined from it,
+    with index 1 being the most recent run. """
+
+    data_file = urllib2.urlopen(API_URL % userid)
+    #   Streamed, so only the run asked for is kept rather than every run
+    #   of the user.
+    items = read_run(data_file, index=index)
+    if not items:
         print("No data for that user.")
         return None
-    return(get_most_recent_path(data))
+    return items
 
-def get_most_recent_path(data):
-    """ Returns path data from a recent DynamoDB entry. Second system argument
-    determines which index to return, with 1 being the most recent. """
+def get_stored_data(userid, index=1, store=None):
+    """ PathRun of a run of userId kept in the local PathStore, with index 1
+    being the most recent, or None if the store has no runs of that user. """
 
-    if len(sys.argv) < 2:
-        pathid = data[u'Items'][-1][u'PathID'][u'S'][:-2]
-    else:
-        pathid = data[u'Items'][-int(sys.argv[2])][u'PathID'][u'S'][:-2]
-    ind_list = []
-    for ind, item in enumerate(data[u'Items']):
-        if pathid in item[u'PathID'][u'S']:
-            ind_list.append(ind)
-    return data[u'Items'][ind_list[0]:ind_list[-1] + 1]
+    store = store if store is not None else PathStore()
+    runs = store.runs(user_id=userid)
+    if len(runs) < index:
+        return None
+    path_id, entry = runs[-index]
+    return PathRun.from_arrays(store.load(path_id), path_id, entry['date'])
+
+#   How many decoded runs path_run keeps, keyed by the PathIDs of their items
+#   (a long run is split over items whose PathIDs differ in the last two
+#   characters), so the same run fetched again is not decoded again.
+RUN_CACHE_SIZE = 8
+_run_cache = []
+
+class PathRun(object):
+    """ The DynamoDB items of one run decoded once into numpy arrays.  Pose
+    matrices are rows of 16 values stored column by column, so the
+    translation is 12..14. """
+
+    def __init__(self, items):
+        if isinstance(items, dict):
+            items = [items]
+        self.items = items
+        self._set_arrays(decode_items(items))
+        self.path_id = items[0][u'PathID'][u'S'] if items and u'PathID' in items[0] else None
+        self.path_date = items[0][u'PathDate'][u'S'] if items and u'PathDate' in items[0] else None
+
+    @classmethod
+    def from_arrays(cls, arrays, path_id=None, path_date=None):
+        """ Run of arrays already decoded, e.g. loaded from a PathStore. """
+
+        run = cls([])
+        run._set_arrays(arrays)
+        run.path_id = path_id
+        run.path_date = path_date
+        return run
+
+    def _set_arrays(self, arrays):
+        self.navigation = arrays['navigation']
+        self.navigation_times = arrays['navigation_times']
+        self.path = arrays['path']
+        self.keypoints = arrays['keypoints']
+        self.speech_text = [str(text) for text in arrays['speech_text']]
+        self.speech_times = arrays['speech_times']
+        self._history = None
+        self._time_order = None
+
+    @property
+    def history(self):
+        """ PoseHistory of the navigation path in time order, built on first
+        use. """
+
+        if self._history is None:
+            order = self.time_order
+            matrices = self.navigation[order].reshape(-1, 4, 4).transpose(0, 2, 1)
+            self._history = PoseHistory.from_arrays(self.navigation_times[order],
+                                                    se3.pose_from_matrix(matrices))
+        return self._history
+
+    @property
+    def time_order(self):
+        """ Indices that sort navigation_times, worked out on first use. """
+
+        if self._time_order is None:
+            self._time_order = np.argsort(self.navigation_times, kind="mergesort")
+        return self._time_order
+
+def path_run(data):
+    """ The PathRun of data, decoding each run only the first time it is
+    seen.  Items without a PathID are decoded every time. """
+
+    if isinstance(data, PathRun):
+        return data
+    items = [data] if isinstance(data, dict) else data
+    key = tuple(item.get(u'PathID', {}).get(u'S') for item in items)
+    cached = key and None not in key
+    for cached_key, run in _run_cache:
+        if cached and cached_key == key:
+            return run
+    run = PathRun(items)
+    if cached:
+        _run_cache.insert(0, (key, run))
+        del _run_cache[RUN_CACHE_SIZE:]
+    return run
 
 def get_navigation_positions(data):
     """ Reads json file and returns a tuple of three numpy arrays
     corresponding to the x, y, and z values of the navigation data. """
 
-    navigationDataList = []
-    for data_piece in data:
-        for matrix in data_piece["navigationData"]["L"]:
-            matrixData = matrix["L"]
-            navigationDataList.append([float(item[u'N']) for item in matrixData])
-    navigationDataList = np.asarray(navigationDataList)
-    return (navigationDataList[:, 12],
-        navigationDataList[:, 13],
-        navigationDataList[:, 14])
+    navigation = path_run(data).navigation
+    return (navigation[:, 12],
+        navigation[:, 13],
+        navigation[:, 14])
 
 def get_navigation_times(data):
     """ Returns a list of all times corresponding to the
     navigation path positions. """
 
-    navigationTimeList = []
-    for data_piece in data:
-        for time in data_piece["navigationDataTime"]["L"]:
-            navigationTimeList.append(float(time[u'N']))
-    navigationTimeList = np.asarray(navigationTimeList)
-    return navigationTimeList
+    return path_run(data).navigation_times
+
+def get_navigation_history(data):
+    """ Returns a PoseHistory of the navigation path, for looking up
+    where the phone was at a given time. """
+
+    return path_run(data).history
 
 def get_keypoint_positions(data):
     """ Reads json file and returns a tuple of three numpy arrays
     corresponding to the x, y, and z values of the keypoint positions."""
 
-    keypointDataList = []
-    for data_piece in data:
-        for pos in data_piece["keypointData"]["L"]:
-            keypointDataList.append([float(item[u'N']) for item in pos[u'L']])
-    keypointDataList = np.asarray(keypointDataList)
-    return (keypointDataList[:, 0],
-        keypointDataList[:, 1],
-        keypointDataList[:, 2])
+    keypoints = path_run(data).keypoints
+    return (keypoints[:, 0],
+        keypoints[:, 1],
+        keypoints[:, 2])
 
 def get_path_positions(data):
     """ Reads json file and returns a tuple of three numpy arrays
     corresponding to the x, y, and z values of the path data. """
 
-    pathDataList = []
-    for data_piece in data:
-        for matrix in data_piece["PathData"]["L"]:
-            matrixData = matrix["L"]
-            pathDataList.append([float(item[u'N']) for item in matrixData])
-    pathDataList = np.asarray(pathDataList)
-    return (pathDataList[:, 12],    #   Rotation matrix X data
-        pathDataList[:, 13],        #   Y data
-        pathDataList[:, 14])        #   Z data
+    path = path_run(data).path
+    return (path[:, 12],    #   Rotation matrix X data
+        path[:, 13],        #   Y data
+        path[:, 14])        #   Z data
 
 def data_map_birdseye(data):
     """ Given json data, plots path and navigation route
@@ -126,6 +197,8 @@ def plot_keypoints(data):
             fig = plt.figure()
             ax = fig.add_subplot(111, projection='3d')
         kx, ky, kz = get_keypoint_positions(data)
+        if not len(kx):
+            raise IndexError("no keypoints")
         ax.scatter(kz, kx, ky)
     except IndexError:
         print("ERROR: No keypoint data found.")
@@ -147,14 +220,39 @@ def iso_scale(xs, ys, zs):
         [avg_y - max_dev, avg_y + max_dev],
         [avg_z - max_dev, avg_z + max_dev])
 
+def align_times(data, times):
+    """ Pairs each of times with the navigation point closest to it in time,
+    all in one searchsorted over the sorted navigation times.  Returns a dict
+    of indices into the navigation path, positions (N, 3) and offsets, how
+    many seconds after its navigation point each time comes. """
+
+    run = path_run(data)
+    times = np.asarray(times, dtype=float)
+    if not len(run.navigation_times):
+        raise ValueError("no navigation data")
+    order = run.time_order
+    sorted_times = run.navigation_times[order]
+    upper = np.clip(np.searchsorted(sorted_times, times), 1, max(len(sorted_times) - 1, 1))
+    lower = upper - 1
+    if len(sorted_times) == 1:
+        nearest = np.zeros(times.shape, dtype=np.int64)
+    else:
+        nearest = np.where(np.abs(sorted_times[upper] - times) < np.abs(times - sorted_times[lower]),
+                           upper, lower)
+    indices = order[nearest]
+    return {'indices': indices,
+            'positions': run.navigation[indices][..., 12:15],
+            'offsets': times - run.navigation_times[indices]}
+
+def align_instructions(data):
+    """ align_times for every voice instruction of the run. """
+
+    return align_times(data, path_run(data).speech_times)
+
 def nearest_nav_point(data, time):
     """ Finds the index of the closest navigation point to the given time. """
 
-    nx, ny, nz = get_navigation_positions(data)
-    nt = get_navigation_times(data)
-    dif = abs(nt - time)
-    mdif_index, mdif = min(enumerate(dif), key=lambda f:f[1])
-    return mdif_index
+    return int(align_times(data, time)['indices'])
 
 def get_navigation_point(data, index):
     """ Returns the point of the given index from the navigation path. """
@@ -166,31 +264,19 @@ def get_instructions(data):
     """ Gets a list of indexes for points along the path instructions were
     given, and a list of all voice instructions for that path. """
 
-    point_indexes = []
-    for data_piece in data:
-        point_indexes.append([nearest_nav_point(data_piece, time) \
-            for time in get_instruction_times(data_piece)])
-    points = [get_navigation_point(data, index) for index in point_indexes]
+    points = [tuple(point) for point in align_instructions(data)['positions']]
     instructions = get_voice_text(data)
     return points, instructions
 
 def get_voice_text(data):
     """ Get a list of all voice instructions given for that run. """
 
-    voiceDataList = []
-    for string in data["speechData"]["L"]:
-        voiceDataList.append(str(string[u'S']))
-    voiceDataList = np.asarray(voiceDataList)
-    return voiceDataList
+    return np.asarray(path_run(data).speech_text)
 
 def get_instruction_times(data):
     """ Get a list of times that voice instructions were given. """
 
-    instructionTimeList = []
-    for time in data["speechDataTime"]["L"]:
-        instructionTimeList.append(float(time[u'N']))
-    instrucitonTimeList = np.asarray(instructionTimeList)
-    return instructionTimeList
+    return path_run(data).speech_times
 
 def animation_run_3d(data, gen_func):
     try:
@@ -231,20 +317,14 @@ def animation_run_3d(data, gen_func):
         plt.pause(0.1)
 
 def determine_phone(data):
-    id_dict = {"09F2D016-33E8-4FCC-838A-220B8B151328":"Occam Lab iPhone",
-        "899ABF35-B36B-4ACF-9D2F-23CF3A3E549B": "Chris's iPhone"}
-    user_id = sys.argv[1]
-    if user_id in id_dict:
-        phone_id = id_dict[user_id]
-    else:
-        phone_id = "Unknown Device " + user_id[0:4]
-    return phone_id
+    return phone_name(sys.argv[1])
 
 def determine_date(data):
-    pathdate = data[0][u'PathDate'][u'S']
+    run = path_run(data)
+    pathdate = run.path_date
     if pathdate == "0":
         print("ERROR: No header found. Determining date from PathID.")
-        pathdate = data[0][u'PathID'][u'S'][36:]
+        pathdate = run.path_id[36:]
     try:
         monthdict = {"01": "January", "02": "February", "03": "March",
             "04": "April", "05": "May", "06": "June", "07": "July", "08": "August",
@@ -265,7 +345,11 @@ if __name__ == '__main__':
         print("python json_parsing.py data.json")
     else:
         try:
-            data = get_json_data(sys.argv[1])
+            #   Runs imported with prototypes/path_store.py open without the network.
+            index = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+            data = get_stored_data(sys.argv[1], index)
+            if data is None:
+                data = get_json_data(sys.argv[1], index)
             animation_run_3d(data, get_path_positions)
             plot_keypoints(data)
             animation_run_3d(data, get_navigation_positions)
@@ -9,12 +9,11 @@ except:
     import pickle
 
 import rospy
-from geometry_msgs.msg import PoseStamped, Pose, Point, Vector3
+from geometry_msgs.msg import PoseStamped, Pose, Point, Vector3, Quaternion
 from tf.transformations import euler_from_quaternion, quaternion_from_euler, quaternion_multiply
 import tf
 from std_msgs.msg import Header, ColorRGBA, String
 from visualization_msgs.msg import Marker, MarkerArray
-import pyttsx
 from rospkg import RosPack
 from apriltags_ros.msg import AprilTagDetectionArray
 from std_msgs.msg import Header, ColorRGBA
@@ -25,6 +24,17 @@ from copy import deepcopy
 import numpy as np
 from scipy import linalg, matrix
 import scipy
+import shutil
+from g2o_graph import information_diagonal, information_upper, write_g2o
+from g2o_writer import G2OWriter
+from pose_graph_optimizer import IncrementalOptimizer, optimize_graph
+import se3
+from waypoint_index import WaypointIndex
+from transform_queue import TransformRequestQueue
+from pose_history import PoseHistory
+from bearings import clock_directions
+from marker_manager import MarkerManager
+from speech_queue import SpeechQueue, HIGH
 
 def null(a, rtol=1e-5):
     u, s, v = np.linalg.svd(a)
@@ -34,16 +44,20 @@ def null(a, rtol=1e-5):
 class ArWaypointTest(object):
     def __init__(self):
         #### ROS Variables ####
-        self.engine = pyttsx.init()                                     # Speech engine
+        self.speech = SpeechQueue()                                     # Speech, spoken on its own thread
         top = RosPack().get_path('mobility_games')                      # Directory for this ros package
         self.sound_folder = path.join(top, 'auditory/sound_files')      # Location of audio files
 
         rospy.init_node('ar_waypoint_test')                             # Initialization of a nother node.
         self.listener = tf.TransformListener()                          # The transform listener
+        self.transforms = TransformRequestQueue(self.listener)          # Lookups answered once tf has the data, so callbacks never wait on tf
         self.broadcaster = tf.TransformBroadcaster()                    # The transform broadcaster
         self.waypoint_viz_pub = rospy.Publisher('/waypoint_visualizer', # Create a ros puplisher for the marker visualization
                                                 MarkerArray,
                                                 queue_size=10)
+        self.corrected_pose_pub = rospy.Publisher('/corrected_pose',    # Drift corrected pose of the phone from the online optimizer
+                                                  PoseStamped,
+                                                  queue_size=10)
         """self.place_pub = rospy.Publisher('/locations',
                                          String,
                                          queue_size=10)"""
@@ -61,8 +75,8 @@ class ArWaypointTest(object):
         #### Tracker Variables ####
         self.calibration_mode = True                        # Flag to keep track of game state -- Calibration/Run Modes
         self.calibration_AR = False                         # Flag to keep track of game state -- AR Calibration/Other Modes. (this supercedes other modes in priority if turned on)
-        self.waypoints = {}                                 # Dictionary of waypoints
-        self.waypoints_detected = {}                        # Dictionary of currently detected waypoints??
+        self.waypoints = WaypointIndex()                    # Waypoints by name, with a spatial index for proximity queries
+        self.waypoints_detected = set()                     # Names of the waypoints the phone is currently inside
         self.origin_tag = None                              # tag_id of main tag.
         self.supplement_tags = {}                           # Dictionary of tag_id's connected to their poses.
         self.tag_seen = False                               # boolean describing if the first tag has been seen or not.
@@ -70,23 +84,32 @@ class ArWaypointTest(object):
         self.x = None                                       # x position of Tango. Start at None because no data have been received yet.
         self.y = None                                       # y position of Tango
         self.z = None                                       # z position of Tango
+        self.yaw = None                                     # heading of Tango in the AR frame
         self.has_spoken = False                             # Boolean for if the speech engine has spoken
-        self.markerlist = []                                # Empty list, to contain waypoints.
+        self.markers = MarkerManager(self.waypoint_viz_pub) # Waypoint markers, published when they change.
         self.waypoint_id = 0                                # Waypoint_id's
         self.last_record_time = 0                           # Last time of a pose record
-        self.g2o_result = None                              # Result of g2o is the actual information from the file.e
+        self.g2o_result = None                              # Optimized G2OGraph from the last ] press
         self.vertex_id = 586                                # Start id is the id after all the tag ids
         self.recording = False                              # Boolean for recording
+        self.record_pending = False                         # Boolean for a recording whose transforms have been requested but not answered yet
         self.tags_detected = None                           # list of detected tags.
         self.nowtime = None                                 # Timing for the rose pose and
         ## Testing Materials
         self.origin_msg = None                              # Main Tag Msg with all the pose and id info.
         self.lastpose = None                                # Last pose of the phone
+        self.pose_history = PoseHistory()                   # Recent stamped phone poses in odom, for looking up where the phone was at a time
         self.distance_traveled = [0, 0, 0, 0]               # Counter for total traveled distance
         self.testing_tag_id = 1                             # Tag Id for Testing (debugging)
         self.record_interval = self.record_interval_normal  # Interval of time between pose recording for SLAM algorithm
-        self.g2o_data = None                                # Have variable to be prepared for file reading and writing
-        open(self.g2o_data_path, 'wb').close()              # Overwrite current g2o data file
+        self.online = IncrementalOptimizer()                # Sliding window optimizer updated as the graph is recorded
+        self.odom_correction = None                         # Transform from raw odom poses to the online optimizer's corrected ones
+        self.online_pending = None                          # Newest recorded pose id the online optimizer hasn't been updated with yet
+        self.online_budget = 0.05                           # Seconds an online update may take before it is warned about
+        self.online_times = []                              # Seconds taken by each online update
+        self.g2o_data = G2OWriter(self.g2o_data_path,       # Buffered writer for the g2o data file (overwrites the current one)
+                                  mirror=self.online)
+        rospy.on_shutdown(self.g2o_data.close)              # Write out anything still buffered on shutdown
         self.tagtimes = {}                                  # Dictionary of Last recorded tag times
         self.tagrecorded = {}
         for i in range(587):
@@ -108,6 +131,12 @@ class ArWaypointTest(object):
         """
         This function processes the pose, and saves it in the AR frame which can be useful for various features.
         """
+        p = msg.pose.position
+        o = msg.pose.orientation
+        try:
+            self.pose_history.append(msg.header.stamp.to_sec(), (p.x, p.y, p.z, o.x, o.y, o.z, o.w)) # remember where the phone was at this time
+        except ValueError: # out of order message
+            pass
         if self.origin_tag >= 0:
             if (self.lastpose):                                                     # if we didn't just start up and have seen the origin tag
                 movement = [msg.pose.position.x - self.lastpose.pose.position.x,    # calculate the difference in the poses.
@@ -117,29 +146,27 @@ class ArWaypointTest(object):
                     self.distance_traveled[i] += abs(movement[i])                   # record it into the distance traveled.
             try: # try
                 msg.header.stamp = rospy.Time(0)                                    # set the header stamp to now.
-                newitem = self.listener.transformPose('AR', msg)                    # transform the pose into the AR frame
+                newitem = self.pose_in_ar(msg)                                      # the phone pose in the AR frame, drift corrected once possible
                 self.x = newitem.pose.position.x
                 self.y = newitem.pose.position.y
                 self.z = newitem.pose.position.z                                    # record the information from that transformed phone pose.
+                self.yaw = euler_from_quaternion([newitem.pose.orientation.x, newitem.pose.orientation.y,
+                                                  newitem.pose.orientation.z, newitem.pose.orientation.w])[2] # and which way it faces
 
 
                 if not self.calibration_mode and not self.AR_Find_Try:              #if not calibrating. (aka if running)
-                    for waypoint in self.waypoints:                                 #iterate through the waypoints
-                        disttopoint = math.sqrt((self.waypoints[waypoint][0] - self.x)**2       #get the distance to each one
-                                                + (self.waypoints[waypoint][1] - self.y)**2
-                                                + (self.waypoints[waypoint][2] - self.z)**2)
-                        if(disttopoint < self.proximity_to_destination):                        # if the distance is less than the previously set waypoint radius
-                            if not self.waypoints_detected[waypoint]:                           # and the waypoint is not detected
-                                mesg = "Found %s" % waypoint
-                                print mesg                                                      # print the waypoint was found
-                                print "distance to point: " + str(disttopoint)                  # print the distance to the waypoint
-                                self.engine.say(mesg)                                           # have engine read out waypoint
-                                self.waypoints_detected[waypoint] = True                        # make this waypoint detected.
-                                break
-                            else:
-                                print "distance to point: " + str(disttopoint)                  # even if the tag has already been found, print out the distanc to the point
-                        else:                                                                   # if not inside waypoint
-                            self.waypoints_detected[waypoint] = False                           # set its detcted status to false
+                    nearby = self.waypoints.within((self.x, self.y, self.z), self.proximity_to_destination) #waypoints whose radius we are inside, nearest first
+                    self.waypoints_detected &= set(name for name, _ in nearby)              # waypoints we have left are no longer detected
+                    for waypoint, disttopoint in nearby:
+                        if waypoint not in self.waypoints_detected:                         # if the waypoint is not detected
+                            mesg = "Found %s" % waypoint
+                            print mesg                                                      # print the waypoint was found
+                            print "distance to point: " + str(disttopoint)                  # print the distance to the waypoint
+                            self.speech.say(mesg, HIGH)                                     # read out waypoint ahead of anything queued
+                            self.waypoints_detected.add(waypoint)                           # make this waypoint detected.
+                            break
+                        else:
+                            print "distance to point: " + str(disttopoint)                  # even if the tag has already been found, print out the distanc to the point
             except Exception as inst: #Exception
                 print "Exception is", inst # print excetion
         self.lastpose = msg;                                                                    # Lastpose is set to the this pose msg
@@ -162,54 +189,23 @@ class ArWaypointTest(object):
                 print("THIS IS BAD.")
             #print "header difference", headdiff
             #curr_tag_pose.header.stamp = rospy.Time(0) # set the tag_pose stamp to now.
-            self.listener.waitForTransform(curr_tag_pose.header.frame_id, "odom", curr_tag_pose.header.stamp, rospy.Duration(.5))
-            curr_tag_transformed_pose = self.listener.transformPose('odom', curr_tag_pose)  #Transform the pose from the camera frame to the odom frame.
             tag_id = curr_tag.id #save tag_id
             if not tag_id in self.tagtimes.keys():
                 self.tagtimes[tag_id] = rospy.Time(1)
 
-            if (self.calibration_AR and self.AR_Find_Try): # if in Ar calibrate mode and user presses the update button:
-                tagfound = False
-                # Only prompt user to input tag name once
-                if not self.tag_seen: #if we haven't seen a tag
-                    print "Origin Tag Found: " + str(tag_id) #
-                    tagfound = self.RecordTag(curr_tag, True) # Record Tag Vertex (the True boolean is to denote that this is the origin tag and should create a FIX line in g2o)
-                    if tagfound:
-                        self.origin_msg = curr_tag_transformed_pose #make this tag the origin tag
-                        self.origin_tag = tag_id
-                        self.tag_seen = True #set that you have seen the first tag
-                        self.distance_traveled = [0,0,0,0] #set distance to 0
-                    #newfound = True #unnecessary here.
-                if not (tag_id == self.origin_tag): #if the tag_id isn't that of the origin tag.
-                    if not (tag_id in self.supplement_tags.keys()): #if the tag is not in the supplementary tag list
-                        tagfound = self.RecordTag(curr_tag, False) #Record Tag Vertex (for g2o)
-                        if tagfound:
-                            print "Supplementary Tag Found: " + str(tag_id)
-                            self.supplement_tags[tag_id] = curr_tag_transformed_pose #set new supplemental AR Tag
-                            print(self.supplement_tags.keys())
-                    else: #If this is a previously found tag,
-                        tagfound = True
-                        print "Found Old Tag: " + str(tag_id)
-                if not tagfound:
-                    print("No tags found.")
-
-                if tag_id == self.origin_tag and self.tag_seen:
-                    tagfound = True
-                    print "Origin Tag Refound!"
-                    self.origin_msg = curr_tag_transformed_pose #Reset the origin tag
+            find_try = self.calibration_AR and self.AR_Find_Try # if in Ar calibrate mode and user presses the update button (this is reset at the end of this callback)
+            lookups = [("odom", curr_tag_pose.header.frame_id, curr_tag_pose.header.stamp)] # camera to odom, to put the tag pose in the odom frame
+            if find_try:
+                lookups.append(("odom", "tag_"+str(tag_id), curr_tag_pose.header.stamp)) # tag transform for recording the tag vertex
+            self.transforms.request(lookups,
+                                    lambda transforms: self.process_tag(curr_tag, find_try, transforms),
+                                    lambda error: self.transform_failed("tagCallback", error))
 
             if self.tag_seen and tag_id == self.testing_tag_id: #If we have seen the origin and we are now looking at the testing tag:
-                try:
-                    print("tried to record test tag")
-                    self.listener.waitForTransform("AR", "tag_"+str(tag_id), curr_tag.pose.header.stamp, rospy.Duration(.5)) # Wait for tag transform
-                    (trans, rot) = self.listener.lookupTransform("AR", "tag_"+str(tag_id), curr_tag.pose.header.stamp) # Lookup tag transform
-                    self.test_data.write("TAG %f %f %f %f %f %f %f\n" % (trans + rot)) # Write into a G2O file
-                except (tf.ExtrapolationException,
-                        tf.LookupException,
-                        tf.ConnectivityException,
-                        tf.Exception,
-                        ValueError) as e:
-                    print "TestTag Exception: " + str(e)
+                print("tried to record test tag")
+                self.transforms.request([("AR", "tag_"+str(tag_id), curr_tag.pose.header.stamp)], # Lookup tag transform
+                                        self.record_test_tag,
+                                        lambda error: self.transform_failed("TestTag", error))
                 """self.distance_traveled[3] = math.sqrt(math.pow(self.distance_traveled[0], 2) #calculate how far we have traveled since we saw the origin.
                                                       + math.pow(self.distance_traveled[1], 2)
                                                       + math.pow(self.distance_traveled[2], 2))
@@ -227,28 +223,77 @@ class ArWaypointTest(object):
         self.AR_Find_Try = False #Finish trying to find a tag.
 
 
+    def process_tag(self, curr_tag, find_try, transforms):
+        """
+        Handles a tag detection once its transforms are available.  transforms holds the camera to odom transform and, when find_try is set, the odom to tag transform.
+        """
+        tag_id = curr_tag.id
+        trans, rot = transforms[0]
+        pose = se3.compose(trans + rot, (curr_tag.pose.pose.position.x, curr_tag.pose.pose.position.y, curr_tag.pose.pose.position.z,
+                                         curr_tag.pose.pose.orientation.x, curr_tag.pose.pose.orientation.y,
+                                         curr_tag.pose.pose.orientation.z, curr_tag.pose.pose.orientation.w))
+        curr_tag_transformed_pose = PoseStamped(header=Header(stamp=curr_tag.pose.header.stamp, frame_id="odom"), #The pose from the camera frame in the odom frame.
+                                                pose=Pose(position=Point(*pose[0:3]), orientation=Quaternion(*pose[3:7])))
+
+        if find_try: # if in Ar calibrate mode and user presses the update button:
+            tagfound = False
+            # Only prompt user to input tag name once
+            if not self.tag_seen: #if we haven't seen a tag
+                print "Origin Tag Found: " + str(tag_id) #
+                tagfound = self.RecordTag(curr_tag, True, transforms[1]) # Record Tag Vertex (the True boolean is to denote that this is the origin tag and should create a FIX line in g2o)
+                if tagfound:
+                    self.origin_msg = curr_tag_transformed_pose #make this tag the origin tag
+                    self.origin_tag = tag_id
+                    self.tag_seen = True #set that you have seen the first tag
+                    self.distance_traveled = [0,0,0,0] #set distance to 0
+                #newfound = True #unnecessary here.
+            if not (tag_id == self.origin_tag): #if the tag_id isn't that of the origin tag.
+                if not (tag_id in self.supplement_tags.keys()): #if the tag is not in the supplementary tag list
+                    tagfound = self.RecordTag(curr_tag, False, transforms[1]) #Record Tag Vertex (for g2o)
+                    if tagfound:
+                        print "Supplementary Tag Found: " + str(tag_id)
+                        self.supplement_tags[tag_id] = curr_tag_transformed_pose #set new supplemental AR Tag
+                        print(self.supplement_tags.keys())
+                else: #If this is a previously found tag,
+                    tagfound = True
+                    print "Found Old Tag: " + str(tag_id)
+            if not tagfound:
+                print("No tags found.")
+
+            if tag_id == self.origin_tag and self.tag_seen:
+                tagfound = True
+                print "Origin Tag Refound!"
+                self.origin_msg = curr_tag_transformed_pose #Reset the origin tag
+
+
+    def record_test_tag(self, transforms):
+        (trans, rot) = transforms[0]
+        self.test_data.write("TAG %f %f %f %f %f %f %f\n" % (trans + rot)) # Write into a G2O file
+
+
+    def transform_failed(self, name, error):
+        print name + " Exception: " + str(error)
+
+
     def start_record(self):
         if self.calibration_AR and self.recording == False: #If we aren't recording and AR Calibration is on.
-            i = 0
-            while (i < 10):
-                try:
-                    self.nowtime = rospy.Time.now(); # Set Nowtime to Now
-                    self.listener.waitForTransform("odom", "real_device", self.nowtime, rospy.Duration(.5)) #Wait for...
-                    (trans, rot) = self.listener.lookupTransform("odom", "real_device", self.nowtime) # and lookup the transform for phone's current position.
-                    self.g2o_data.write("VERTEX_SE3:QUAT %i %f %f %f %f %f %f %f\n" % ((self.vertex_id+1,) + trans + rot)) # Write the vertex into g2o file.
-                    print('recording started')
-                    self.last_record_time = self.nowtime # set last record time to nowtime as well.
-                    self.vertex_id += 2 # add to the vertex id
-                    self.recording = True #set recording true
-                    self.tags_detected = None #set tags detected to none so as to not see tags during the first record.
-                    i = 10
-                except (tf.ExtrapolationException,
-                        tf.LookupException,
-                        tf.ConnectivityException,
-                        tf.Exception,
-                        ValueError) as e:
-                    print "recordStart Exception: " + str(e)
-                    i += 1
+            if not len(self.pose_history):
+                print "recordStart Exception: no pose received yet"
+                return
+            stamp, pose = self.pose_history.latest() # the phone's current position.
+            self.nowtime = rospy.Time.from_sec(stamp)
+            self.g2o_data.add_vertex(self.vertex_id+1, pose[0:3], pose[3:7]) # Write the vertex into g2o file.
+            print('recording started')
+            self.last_record_time = self.nowtime # set last record time to nowtime as well.
+            self.vertex_id += 2 # add to the vertex id
+            self.recording = True #set recording true
+            self.tags_detected = None #set tags detected to none so as to not see tags during the first record.
+
+
+    def record_failed(self, error):
+        print "record Exception: " + str(error)
+        self.pose_failure = True
+        self.record_pending = False
 
 
     def key_pressed(self, msg):
@@ -269,18 +314,16 @@ class ArWaypointTest(object):
             self.calibration_AR = not self.calibration_AR; #Toggle calibration_AR
             if self.calibration_AR: # If AR Calibration just turned on,
                 print('switched to AR Calibration Mode') #print message
-                self.g2o_data = open(self.g2o_data_path, 'ab')
-                if path.getsize(self.g2o_data_path) > 0:
-                    self.g2o_data.write('\n')
                 self.start_record()
 
             else: #if AR Calibration just turned off.
                 try:
-                    self.g2o_data.close() #Try closing the g2o file
+                    self.g2o_data.flush() #Make sure everything recorded so far is in the g2o file
+                    self.test_data.flush()
                     self.recording = False # Turn of the recording
                     print('recording stopped')
-                except:
-                    print("file close exception")
+                except (IOError, OSError) as e:
+                    print("file flush exception: " + str(e))
                 if self.calibration_mode: #If Calibration is on.
                     print('switched to Calibration Mode')
                 else: #If Calibration is off
@@ -293,8 +336,13 @@ class ArWaypointTest(object):
             if self.recording:
                 print("Please finish AR_calibration before executing g2o")
             else:
-                system("g2o -o %s %s" % (self.g2o_result_path, self.g2o_data_path)) #Run G2o
-                system("cp %s %s" % (self.g2o_data_path, self.g2o_data_copy_path)) #Copy Original Data
+                try:
+                    self.g2o_data.flush() #Make sure the data file is complete before copying it
+                    shutil.copyfile(self.g2o_data_path, self.g2o_data_copy_path) #Copy Original Data, kept even if optimizing fails
+                    self.g2o_result = optimize_graph(self.g2o_data.graph()) #Optimize the recorded graph in memory
+                    write_g2o(self.g2o_result_path, self.g2o_result) #Write the result where g2o -o used to
+                except (IOError, OSError, ValueError, KeyError, np.linalg.LinAlgError) as e: #The g2o binary's failures never reached the node; in process they would end the callback
+                    print("g2o result exception: " + repr(e))
 
         """if msg.code == ord('p'):
             ""
@@ -317,17 +365,14 @@ class ArWaypointTest(object):
             """
             Read out the nearby waypoints.
             """
-            nearways = [] #set list of nearby waypoints to an empty list
-            for waypoint in self.waypoints: #for each waypoint
-                disttopoint = math.sqrt((self.waypoints[waypoint][0] - self.x)**2 + (self.waypoints[waypoint][1] - self.y)**2 + 4*(self.waypoints[waypoint][2] - self.z)**2) #determine distance
-                if(disttopoint < self.search_dist): #if distance is less than search distance
-                    nearways.append(waypoint) #add it to the list
+            nearways = [name for name, _ in self.waypoints.within((self.x, self.y, self.z), self.search_dist, z_scale=2)] #waypoints within search distance, height differences counting double
             if len(nearways) > 0: #if there are nearby waypoints
-                self.engine.say('Here are some nearby waypoints ') #say here are some nearby waypoints
-                for way in nearways:
-                    self.engine.say(way) #say each waypoint
+                if self.yaw is not None: #if we know which way the phone faces, say where each waypoint is
+                    _, _, hours = clock_directions((self.x, self.y, self.z), self.yaw, [self.waypoints[name] for name in nearways])
+                    nearways = ["%s at %i o'clock" % (name, hour) for name, hour in zip(nearways, hours)]
+                self.speech.say('Here are some nearby waypoints. ' + '. '.join(nearways), key='nearby') #say each waypoint, replacing a list not yet read out
             else:
-                self.engine.say('No nearby waypoints') #if no nearby points say nothing.
+                self.speech.say('No nearby waypoints', key='nearby') #if no nearby points say nothing.
 
         if msg.code == ord('.'):
             """
@@ -359,7 +404,7 @@ class ArWaypointTest(object):
                         print(str(s) + ' is an invalid number.')
                     else:
                         self.waypoints.pop(deletedpoint, None)
-                        self.waypoints_detected.pop(deletedpoint, None)
+                        self.waypoints_detected.discard(deletedpoint)
                         print('deleted waypoint: ' + str(deletedpoint))
 
         if msg.code == ord('a'):
@@ -387,9 +432,8 @@ class ArWaypointTest(object):
                                             color=ColorRGBA(r=random(), g=random(), b=random(), a=1.0),
                                             id = self.waypoint_id,
                                             ns = waypoint_name)
-                self.markerlist.append(newpoint) # append the marker to the markerlist
+                self.markers.set(newpoint) # add the marker to the published markers
                 self.waypoints[waypoint_name] = waypoint_location #add the new waypoint to the waypoints dictionary
-                self.waypoints_detected[waypoint_name] = False # add a false to the waypoint detected dictionary
                 self.waypoint_id += 1 #add to the waypoint id (this is just for setting markers as different ids.)
                 print self.waypoints
 
@@ -400,7 +444,7 @@ class ArWaypointTest(object):
             print("WAYPOINTS SAVED")
             # TODO(rlouie):
             with open('/home/juicyslew/catkin_ws/saved_calibration.pkl', 'wb') as f: #write to waypoint file
-                pickle.dump(self.waypoints, f) #DUMP WAYPOINTS INTO THE PICKLE LOCATION
+                pickle.dump(self.waypoints.as_dict(), f) #DUMP WAYPOINTS INTO THE PICKLE LOCATION
 
         if msg.code == ord('l'):
             """
@@ -408,15 +452,16 @@ class ArWaypointTest(object):
             """
             print("WAYPOINTS LOADED")
             with open('/home/juicyslew/catkin_ws/saved_calibration.pkl', 'rb') as f: #read waypoint file
-                self.waypoints = pickle.load(f) #load pickle
-                self.markerlist = [] #start a markerlist
+                self.waypoints = WaypointIndex(pickle.load(f)) #load pickle and index it
+                self.waypoints_detected = set()
+                self.markers.clear() #remove the old waypoint markers
                 self.waypoint_id = 0 #set waypoint id to 0
                 scale = 2*self.proximity_to_destination #set scale
                 for item in self.waypoints.items(): #for each waypoint
                     """olditem1_1 = item[1][1]
                     item[1][1] = item[1][2]
                     item[1][2] = olditem1_1"""
-                    self.markerlist.append(Marker(header=Header(frame_id="AR", stamp=rospy.Time(0)), #add markers for waypoints to the markerlist
+                    self.markers.set(Marker(header=Header(frame_id="AR", stamp=rospy.Time(0)), #add markers for waypoints
                                                 type=Marker.SPHERE,
                                                 pose=Pose(position=Point(x=item[1][0], y=item[1][1], z = item[1][2])),
                                                 scale=Vector3(x=scale,y=scale,z=scale),
@@ -429,79 +474,112 @@ class ArWaypointTest(object):
 
     def start_speech_engine(self):
         """
-        Initialize the speech engine.
-        This janky speech engine requires this janky startup.
+        Greet the user once the speech is up.
         """
-        if not self.has_spoken: #this doesn't make sense, but it works.
-            self.engine.say("Starting up.")
-            a = self.engine.runAndWait()
-            self.engine.say("Hello.")
-            a = self.engine.runAndWait()
+        if not self.has_spoken:
+            self.speech.say("Starting up.")
+            self.speech.say("Hello.")
             self.has_spoken = True
 
 
-    def RecordTag(self, tag, is_origin_tag):
+    def RecordTag(self, tag, is_origin_tag, transform):
         """
-        This function records tags to the g2o file.
+        This function records tags to the g2o file.  transform is the odom to tag transform at the detection.
         """
         if self.tagrecorded[tag.id]:
             print("tag_%i already found." % tag.id)
         else:
             print("Attempted to find tag_%i" % tag.id)
-            try:
-                self.listener.waitForTransform("odom", "tag_"+str(tag.id), tag.pose.header.stamp, rospy.Duration(.5)) # Wait for tag transform
-                (trans, rot) = self.listener.lookupTransform("odom", "tag_"+str(tag.id), tag.pose.header.stamp) # Lookup tag transform
-                self.g2o_data.write("VERTEX_SE3:QUAT %i %f %f %f %f %f %f %f\n" % ((tag.id,) + trans + rot)) # Write into a G2O file
-                if is_origin_tag: #if the tag is the origin tag
-                    self.g2o_data.write("FIX %i\n" % tag.id) #write it in as the fix point in g2o
-                print("recorded tag: " + str(tag.id))
-                self.tagrecorded[tag.id] = True
-                return True
-            except (tf.ExtrapolationException,
-                    tf.LookupException,
-                    tf.ConnectivityException,
-                    tf.Exception,
-                    ValueError) as e:
-                print "recordTag Exception: " + str(e)
-                return False
+            (trans, rot) = transform
+            self.g2o_data.add_vertex(tag.id, trans, rot) # Write into a G2O file
+            if is_origin_tag: #if the tag is the origin tag
+                self.g2o_data.add_fix(tag.id) #write it in as the fix point in g2o
+            print("recorded tag: " + str(tag.id))
+            self.tagrecorded[tag.id] = True
+            return True
+
+
+    def update_online(self, pose_id):
+        """
+        Runs one sliding window update of the online optimizer and publishes the corrected pose of pose_id.  Called from the run loop, so the solve never holds up a callback.
+        """
+        start = time.time()
+        self.online.update()
+        self.odom_correction = self.online.correction(pose_id) #maps raw odom poses onto the corrected graph
+        elapsed = time.time() - start
+        self.online_times.append(elapsed)
+        rospy.logdebug("online update of pose %i took %.1f ms", pose_id, 1000 * elapsed)
+        if elapsed > self.online_budget:
+            rospy.logwarn("online update of pose %i took %.1f ms", pose_id, 1000 * elapsed)
+        pose = self.online.pose(pose_id)
+        self.corrected_pose_pub.publish(PoseStamped(header=Header(stamp=self.nowtime, frame_id="odom"),
+                                                    pose=Pose(position=Point(*pose[0:3]),
+                                                              orientation=Quaternion(*pose[3:7]))))
+
+
+    def pose_in_ar(self, msg):
+        """
+        Returns an odom frame PoseStamped as a pose in the AR frame.  The tf AR frame was placed from raw odometry, so the raw pose goes through tf until the origin tag is in the online graph.  From then on the corrected pose is taken relative to the origin tag's estimate in that same corrected graph.
+        """
+        correction = self.odom_correction
+        if correction is None or self.origin_tag not in self.online:
+            return self.listener.transformPose('AR', msg)
+        p = msg.pose.position
+        o = msg.pose.orientation
+        pose = se3.compose(correction, (p.x, p.y, p.z, o.x, o.y, o.z, o.w))
+        pose = se3.compose(se3.invert(self.online.pose(self.origin_tag)), pose)
+        return PoseStamped(header=Header(stamp=msg.header.stamp, frame_id='AR'),
+                           pose=Pose(position=Point(*pose[0:3]),
+                                     orientation=Quaternion(*pose[3:7])))
 
 
     def RecordTime(self, ofst):
+        """
+        Records the newest pose in the pose history.  Tag transforms are requested from tf; record_pose writes everything once they arrive.
+        """
+        if not len(self.pose_history):
+            return
+        stamp, pose = self.pose_history.latest() # newest tango pose
+        stamp = rospy.Time.from_sec(stamp)
+        if stamp <= self.last_record_time: # no new pose since the last record
+            return
+        self.nowtime = stamp
+        lookups = []
+        tags = [] # (tag_id, stamp) of each tag to connect to this pose
+        if self.tags_detected and self.tag_seen: #if there were tags detected
+            for tag in self.tags_detected: #for each tag
+                tag_stamp = tag.pose.header.stamp
+                if (tag_stamp - self.tagtimes[tag.id]) > rospy.Duration(.025):
+                    if tag.id == self.origin_tag: #if it is the origin tag
+                        frame = "AR"
+                    else:
+                        #vvvv This isn't working
+                        frame = "AR_" + str(tag.id)
+                    if self.listener.frameExists(frame): #make sure transform exists
+                        tags.append((tag.id, tag_stamp))
+                        lookups.append(("real_device", stamp, "tag_"+str(tag.id), tag_stamp, "odom")) #transform from phone to tag
+        test_pose = self.listener.frameExists("AR")
+        if test_pose:
+            lookups.append(("AR", "real_device", stamp)) #The AR to Real Device Transform
+        self.record_pending = True
+        self.transforms.request(lookups,
+                                lambda transforms: self.record_pose(stamp, pose, tags, test_pose, transforms),
+                                self.record_failed)
+
+
+    def record_pose(self, stamp, pose, tags, test_pose, transforms):
+        """
+        Writes a pose, its orientation dummy and its tag edges once RecordTime's transforms have arrived.
+        """
+        self.record_pending = False
+        if not self.recording:
+            return
+        tag_transforms = transforms[0:len(tags)]
+        self.nowtime = stamp
         try:
-            self.nowtime = rospy.Time.now() # set nowtime to now
-            self.listener.waitForTransform("odom", "real_device", self.nowtime, rospy.Duration(.5))
-            (trans, rot) = self.listener.lookupTransform("odom", "real_device", self.nowtime) #lookup current pose
-            self.listener.waitForTransformFull("real_device", self.last_record_time, "real_device", self.nowtime, "odom", rospy.Duration(.5))
-            (trans2, rot2)= self.listener.lookupTransformFull("real_device", self.last_record_time, "real_device", self.nowtime, "odom") #lookup relative pose from last recorded tango pose to this tango pose
-            tagtrans = {} # dictionary of tag translations
-            tagrot = {} # dictionary of tag rotations
-            if self.tags_detected and self.tag_seen: #if there were tags detected
-                #print('1')
-                #print self.tags_detected
-                for tag in self.tags_detected: #for each tag
-                    #print('3')
-                    tag_stamp = tag.pose.header.stamp
-                    if (tag_stamp - self.tagtimes[tag.id]) > rospy.Duration(.025):
-                        if tag.id == self.origin_tag: #if it is the origin tag
-                            if self.listener.frameExists("AR"): #make sure transform exists
-                                self.listener.waitForTransformFull("real_device", self.nowtime, "tag_"+str(tag.id), tag_stamp, "odom", rospy.Duration(.5))
-                                (trans3, rot3)= self.listener.lookupTransformFull("real_device", self.nowtime, "tag_"+str(tag.id), tag_stamp, "odom") #lookup transform from phone to tag
-                                tagtrans[tag.id] = trans3 #record findings
-                                tagrot[tag.id] = rot3
-                                self.tagtimes[tag.id] = tag.pose.header.stamp
-                                #print(self.tagtimes)
-                        else:
-                            #print'4'
-                            #vvvv This isn't working
-                            if self.listener.frameExists("AR_" + str(tag.id)): #make sure transform exists
-                                #print'5'
-                                self.listener.waitForTransformFull("real_device", self.nowtime, "tag_"+str(tag.id), tag_stamp, "odom", rospy.Duration(.5))
-                                (trans3, rot3)= self.listener.lookupTransformFull("real_device", self.nowtime, "tag_"+str(tag.id), tag_stamp, "odom") #lookup transform from phone to tag
-                                tagtrans[tag.id] = trans3 #record findings
-                                tagrot[tag.id] = rot3
-                                self.tagtimes[tag.id] = tag.pose.header.stamp
-                                #print(self.tagtimes)
-
+            trans, rot = pose[0:3], pose[3:7] #current pose
+            relative = self.pose_history.relative(self.last_record_time.to_sec(), stamp.to_sec()) #relative pose from last recorded tango pose to this tango pose
+            trans2, rot2 = relative[0:3], relative[3:7]
             #for step in np.arange(0, 3*np.pi, .05):
             q2 = quaternion_from_euler(0, 0, .05)
             qsecondrotation = quaternion_multiply(q2, rot)
@@ -518,52 +596,43 @@ class ArWaypointTest(object):
             basis = np.hstack((v[np.newaxis].T, u))
             # place high information content on pitch and roll and low on chanages in
             I = basis.dot(np.diag([.001, 1000, 1000])).dot(basis.T)
-
-            indeces = np.triu_indices(3)
+            I_dummy = np.zeros((6, 6))
+            I_dummy[3:, 3:] = I                                 # only the rotation block of the dummy edge carries information
 
             ## Writing Pose Information ##
-            self.g2o_data.write("VERTEX_SE3:QUAT %i %f %f %f %f %f %f %f\n" % ((self.vertex_id+1,) + trans + rot)) #write vertex for the new pose
-            self.g2o_data.write("EDGE_SE3:QUAT %i %i %f %f %f %f %f %f %f " % ((self.vertex_id-1,self.vertex_id+1) + trans2 + rot2)) #write edge for moving from the last pose to the current pose
+            self.g2o_data.add_vertex(self.vertex_id+1, trans, rot) #write vertex for the new pose
             if (self.pose_failure):
-                self.g2o_data.write("%f 0 0 0 0 0 %f 0 0 0 0 %f 0 0 0 %f 0 0 %f 0 %f\n" % (0, 0, 0, 0, 0, 0)) #write edge importance matrix
+                I_pose = information_diagonal(0) #no information for an edge over a pose failure
             else:
-                self.g2o_data.write("%f 0 0 0 0 0 %f 0 0 0 0 %f 0 0 0 %f 0 0 %f 0 %f\n" % (1, 1, 1, 1, 1, 1)) #write edge importance matrix
+                I_pose = information_diagonal(1)
+            self.g2o_data.add_edge(self.vertex_id-1, self.vertex_id+1, trans2, rot2, I_pose) #write edge for moving from the last pose to the current pose
 
             ## Writing Orientation Dummy ##
-            self.g2o_data.write("VERTEX_SE3:QUAT %i %f %f %f %f %f %f %f\n" % ((self.vertex_id+2,) + (0,0,0) + rot))
-            self.g2o_data.write("EDGE_SE3:QUAT %i %i %f %f %f %f %f %f %f " % ((self.vertex_id+1,self.vertex_id+2) + (0,0,0) + (0,0,0,1))) #write edge for moving from the last pose to the current pose
-            if (self.pose_failure):
-                self.g2o_data.write("0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 %f %f %f %f %f %f\n" % (tuple(I[indeces])))
-            else:
-                self.g2o_data.write("0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 %f %f %f %f %f %f\n" % (tuple(I[indeces])))
-            self.g2o_data.write("FIX %i\n" % (self.vertex_id+2))
+            self.g2o_data.add_vertex(self.vertex_id+2, (0,0,0), rot)
+            self.g2o_data.add_edge(self.vertex_id+1, self.vertex_id+2, (0,0,0), (0,0,0,1), information_upper(I_dummy))
+            self.g2o_data.add_fix(self.vertex_id+2)
 
             ## Writing Tag Information ##
-            for tag_id in tagtrans.keys(): # for each tag found in this recording
+            for (tag_id, tag_stamp), (trans3, rot3) in zip(tags, tag_transforms): # for each tag found in this recording
                 print("recorded old id: %s" %tag_id)
-                self.g2o_data.write("EDGE_SE3:QUAT %i %i %f %f %f %f %f %f %f " % ((self.vertex_id+1, tag_id) + tagtrans[tag_id] + tagrot[tag_id])) #write edge from the phone to the tag
-                self.g2o_data.write("%f 0 0 0 0 0 %f 0 0 0 0 %f 0 0 0 %f 0 0 %f 0 %f\n" % (100, 100, 100, 100, 100, 100)) #write edge importance matrix
+                self.g2o_data.add_edge(self.vertex_id+1, tag_id, trans3, rot3, information_diagonal(100)) #write edge from the phone to the tag
+                self.tagtimes[tag_id] = tag_stamp
 
 
             #print('record pose')
             self.vertex_id += 2 #increment vertex id
-            self.last_record_time = self.nowtime #set previous record time to current record time.
+            self.online_pending = self.vertex_id-1 #the run loop corrects drift with the newly recorded pose
+            self.last_record_time = stamp #set previous record time to current record time.
             self.pose_failure = False
 
             ## Writing Testing Data ##
-            if self.listener.frameExists("AR"):
-                self.listener.waitForTransform("AR", "real_device", self.nowtime, rospy.Duration(.5))
-                (trans4, rot4) = self.listener.lookupTransform("AR", "real_device", self.nowtime) #lookup The AR to Real Device Transform
+            if test_pose:
+                (trans4, rot4) = transforms[-1] #The AR to Real Device Transform
                 self.test_data.write("PATH %f %f %f %f %f %f %f\n" %(trans4 + rot4)) #write to test file.
 
-        except (tf.ExtrapolationException,
-                tf.LookupException,
-                tf.ConnectivityException,
-                tf.Exception,
-                ValueError) as e:
+        except ValueError as e:
             print "recordTime Exception: " + str(e)
             self.pose_failure = True
-            #self.nowtime = rospy.Time.now(); # Set Nowtime to Now
 
 
     def run(self):
@@ -573,14 +642,21 @@ class ArWaypointTest(object):
         self.start_speech_engine()
         print "Ready to go."
         while not rospy.is_shutdown():
-            if self.calibration_AR and self.recording: # if calibration_AR and recording
+            self.transforms.process() # answer transform requests, and time out the ones tf can't (only here, so their callbacks run on this thread)
+            if self.calibration_AR and self.recording and not self.record_pending: # if calibration_AR and recording, and the last record is done
                 toffset = rospy.Time.now() - self.last_record_time # find the time offset between last recorded time and now
                 if toffset > self.record_interval: # if that offset is greater than the record interval
                     self.RecordTime(toffset) #Record to g2o
-            for marker in self.markerlist: #for marker
-                marker.header.stamp = rospy.Time.now() #set the stamp to now.
-            self.waypoint_viz_pub.publish(self.markerlist) #publish the marker list.
+            if self.online_pending is not None: # a pose was recorded since the last online update
+                pose_id, self.online_pending = self.online_pending, None
+                self.update_online(pose_id) # correct drift with it
+            self.markers.publish() #publish the markers that changed, if any.
             r.sleep()
+        print "Speech:", self.speech.stats() # how many announcements were spoken, and how late
+        if self.online_times:
+            print "Online updates: %i, mean %.1f ms, max %.1f ms" % (len(self.online_times),
+                                                                    1000 * np.mean(self.online_times),
+                                                                    1000 * max(self.online_times))
 
 
 
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+def clock_directions(position, yaw, targets):
+    """ Where each of an (N, 3) array of targets is from someone at position
+    facing yaw.  Returns (distances, bearings, hours), each of length N:
+    distances along the floor, bearings in radians relative to the facing
+    direction in (-pi, pi] and positive to the right, and the nearest clock
+    hour, 12 being straight ahead and 3 to the right. """
+
+    targets = np.asarray(targets, dtype=float).reshape(-1, 3)
+    dx = targets[:, 0] - position[0]
+    dy = targets[:, 1] - position[1]
+    distances = np.hypot(dx, dy)
+    bearings = yaw - np.arctan2(dy, dx)
+    bearings = np.pi - np.mod(np.pi - bearings, 2 * np.pi)
+    hours = np.floor(np.mod(bearings * 6 / np.pi + 0.5, 12)).astype(int)
+    hours[hours == 0] = 12
+    return distances, bearings, hours
+
+if __name__ == "__main__":
+    import time
+    rng = np.random.RandomState(0)
+    targets = rng.rand(100000, 3) * 100
+    start = time.time()
+    clock_directions((50, 50, 0), 0.3, targets)
+    print("%i targets: %.1f ms" % (len(targets), 1e3 * (time.time() - start)))
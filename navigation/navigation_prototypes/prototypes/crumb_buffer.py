@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import os
+import numpy as np
+
+class CrumbBuffer(object):
+    """ Growable (N, 3) array of breadcrumb positions.  Appending is amortized
+    O(1): the storage doubles when full instead of being reallocated for every
+    crumb.  view() is the filled part of the storage, not a copy, so it is
+    only valid until the next append.
+
+    With spill_path set, storage that would grow beyond spill_rows rows moves
+    into a memory mapped file at that path, so very long recordings don't
+    have to fit in memory. """
+
+    def __init__(self, capacity=256, spill_path=None, spill_rows=1 << 20):
+        self.spill_path = spill_path
+        self.spill_rows = spill_rows
+        self._data = np.zeros((capacity, 3))
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, point):
+        if self._count == len(self._data):
+            self._grow(2 * len(self._data))
+        self._data[self._count] = point
+        self._count += 1
+
+    def view(self):
+        """ The crumbs so far, oldest first. """
+
+        return self._data[:self._count]
+
+    def clear(self):
+        self._count = 0
+
+    @property
+    def spilled(self):
+        return isinstance(self._data, np.memmap)
+
+    def _grow(self, capacity):
+        if self.spill_path is None or capacity <= self.spill_rows:
+            data = np.zeros((capacity, 3))
+            data[:self._count] = self._data[:self._count]
+            self._data = data
+        elif not self.spilled:
+            data = np.memmap(self.spill_path, dtype=float, mode='w+', shape=(capacity, 3))
+            data[:self._count] = self._data[:self._count]
+            self._data = data
+        else:
+            #   Extend the file in place and map it again; rows already
+            #   written stay where they are.
+            self._data.flush()
+            del self._data
+            with open(self.spill_path, 'r+b') as spill_file:
+                spill_file.truncate(capacity * 3 * np.dtype(float).itemsize)
+            self._data = np.memmap(self.spill_path, dtype=float, mode='r+', shape=(capacity, 3))
+
+    def close(self):
+        """ Drops the crumbs and removes the spill file, if there is one. """
+
+        spilled = self.spilled
+        self._data = np.zeros((0, 3))
+        self._count = 0
+        if spilled and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+
+if __name__ == "__main__":
+    import time
+    for count in (10000, 100000, 1000000):
+        crumbs = CrumbBuffer()
+        point = np.zeros(3)
+        start = time.time()
+        for i in range(count):
+            crumbs.append(point)
+        print("%7i crumbs: %.2f us per append" % (count, 1e6 * (time.time() - start) / count))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+import codecs
+import heapq
+import json
+import re
+from collections import deque
+from datetime import datetime
+import numpy as np
+
+#   Reads DynamoDB responses ({"Items": [...], "Count": ...}) a piece at a
+#   time, so only the item being decoded and the runs being kept are ever in
+#   memory rather than every path of a user.  While an item is decoded its
+#   numeric lists become float arrays: [{"N": "1.5"}, ...] is kept as one
+#   array, and a list of equally long numeric lists (the pose matrices) as one
+#   2-D array, each under "L" as before, which path_store.decode_items reads.
+
+CHUNK_SIZE = 1 << 16
+
+ITEMS_START = re.compile(r'"Items"\s*:\s*\[')
+SEPARATORS = re.compile(r'[\s,]*')
+DATE = re.compile(r'(\d{4})-(\d\d)-(\d\d)(?:T(\d\d):(\d\d)(?::(\d\d))?)?')
+
+def _numeric(obj):
+    """ object_hook turning DynamoDB numbers and numeric lists into floats
+    and arrays as the decoder finishes each object. """
+
+    if len(obj) != 1:
+        return obj
+    if u'N' in obj:
+        return float(obj[u'N'])
+    values = obj.get(u'L')
+    if not values:
+        return obj
+    if all(type(value) is float for value in values):
+        return {u'L': np.array(values, dtype=float)}
+    if all(type(value) is dict and isinstance(value.get(u'L'), np.ndarray)
+           and value[u'L'].ndim == 1 for value in values):
+        rows = [value[u'L'] for value in values]
+        if all(len(row) == len(rows[0]) for row in rows):
+            array = np.empty((len(rows), len(rows[0])))
+            for i, row in enumerate(rows):
+                array[i] = row
+            return {u'L': array}
+    return obj
+
+_decoder = json.JSONDecoder(object_hook=_numeric)
+#   When filtering, each item is first decoded plainly, which is much quicker,
+#   to read its own PathID, and only those kept are decoded again into arrays.
+_skipper = json.JSONDecoder()
+
+def iter_items(stream, path_id=None, chunk_size=CHUNK_SIZE):
+    """ Yields the items of a DynamoDB response read from stream (a file or
+    HTTP response, bytes or text) one at a time, keeping only those whose
+    PathID starts with path_id if given. """
+
+    decode = codecs.getincrementaldecoder('utf-8')().decode
+
+    def read(size):
+        """ size characters or so, fewer only at the end of stream, however
+        little each stream.read returns. """
+
+        pieces = []
+        count = 0
+        while count < size:
+            data = stream.read(size - count)
+            if not data:
+                break
+            if isinstance(data, bytes):
+                data = decode(data)
+            pieces.append(data)
+            count += len(data)
+        return u"".join(pieces)
+
+    text = u""
+    while True:
+        start = ITEMS_START.search(text)
+        if start:
+            break
+        data = read(chunk_size)
+        if not data:
+            return
+        text += data
+    position = start.end()
+    #   Items of a response tend to be alike in size, so enough is read ahead
+    #   for the largest one yet to be decoded in one go.
+    read_size = chunk_size
+    while True:
+        position = SEPARATORS.match(text, position).end()
+        if len(text) - position < read_size:
+            data = read(read_size)
+            if data:
+                text = text[position:] + data
+                position = 0
+                continue
+        if position == len(text):
+            raise ValueError("DynamoDB response ends inside Items")
+        if text[position] == u']':
+            return
+        decoder = _decoder if path_id is None else _skipper
+        try:
+            item, end = decoder.raw_decode(text, position)
+        except ValueError:
+            #   The item isn't all read yet.  Read at least as much again as
+            #   is buffered, so a long item is decoded a bounded number of times.
+            data = read(len(text) - position)
+            if not data:
+                raise
+            text = text[position:] + data
+            position = 0
+            continue
+        read_size = max(read_size, end - position)
+        keep = path_id is None or item.get(u'PathID', {}).get(u'S', u"").startswith(path_id)
+        if keep and decoder is _skipper:
+            item = _decoder.raw_decode(text, position)[0]
+        text = text[end:]
+        position = 0
+        if keep:
+            yield item
+
+def iter_runs(stream, path_id=None, chunk_size=CHUNK_SIZE):
+    """ Yields the items of each run of a response as a list, as the runs come.
+    The items of one run (whose PathIDs differ only in their last two
+    characters) come one after the other in a response. """
+
+    run = []
+    for item in iter_items(stream, path_id, chunk_size):
+        if run and item[u'PathID'][u'S'][:-2] != run[0][u'PathID'][u'S'][:-2]:
+            yield run
+            run = []
+        run.append(item)
+    if run:
+        yield run
+
+def path_date(item):
+    """ Date of the run of an item as text: its PathDate or, for runs with
+    none, the end of its PathID, after the 36 character id of the phone. """
+
+    date = item.get(u'PathDate', {}).get(u'S', "0")
+    if date == "0":
+        date = item[u'PathID'][u'S'][36:-2]
+    return date
+
+def parse_date(date):
+    """ datetime of a date such as 2017-07-01T10:00:00, to the second, or
+    datetime.min for text that isn't one. """
+
+    match = DATE.match(date)
+    try:
+        return datetime(*[int(part or 0) for part in match.groups()])
+    except (AttributeError, ValueError):
+        return datetime.min
+
+def run_order(path_id, date):
+    """ Sort key putting runs oldest first, by parsed date then PathID.
+    PathStore.runs and read_run both order runs by it. """
+
+    return (parse_date(date), path_id)
+
+def read_run(stream, path_id=None, index=1):
+    """ The items of the run path_id of a response, or without path_id of its
+    index-th most recent run by run_order, with 1 being the most recent.
+    Returns [] if there is no such run. """
+
+    if path_id is not None:
+        runs = deque(iter_runs(stream, path_id), maxlen=1)
+        return runs[0] if runs else []
+    latest = heapq.nlargest(index, iter_runs(stream), key=lambda items:
+                            run_order(items[0][u'PathID'][u'S'], path_date(items[0])))
+    return latest[index - 1] if len(latest) == index else []
+
+if __name__ == "__main__":
+    import sys
+    import time
+    if len(sys.argv) < 2:
+        print("usage: dynamodb_stream.py response.json [path_id]")
+        sys.exit(1)
+    start = time.time()
+    with open(sys.argv[1], 'rb') as response_file:
+        for run in iter_runs(response_file, sys.argv[2] if len(sys.argv) > 2 else None):
+            print("%s  %i items" % (run[0][u'PathID'][u'S'], len(run)))
+    print("%.2f s" % (time.time() - start))
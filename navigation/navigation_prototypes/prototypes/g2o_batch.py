@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+import csv
+import os
+import sys
+import time
+from multiprocessing import Pool
+import numpy as np
+from g2o_graph import load_g2o
+from g2o_metrics import edge_corrections, pose_corrections, pose_rows, tag_rows
+
+#   Drift and correction statistics for a whole directory of recorded runs,
+#   one run per worker process, gathered into one table.
+
+COLUMNS = (('run', '%s'), ('poses', '%i'), ('tags', '%i'), ('path_m', '%.1f'),
+           ('correction_mean_m', '%.3f'), ('correction_max_m', '%.3f'),
+           ('correction_final_m', '%.3f'), ('drift_percent', '%.2f'),
+           ('yaw_correction_max_deg', '%.1f'), ('odometry_edges', '%i'), ('edge_change_mean_m', '%.4f'),
+           ('edge_change_max_m', '%.4f'), ('seconds', '%.2f'))
+
+def find_runs(directory):
+    """ The run directories under directory, those with a result.g2o, or
+    directory itself if it is one. """
+
+    if os.path.exists(os.path.join(directory, "result.g2o")):
+        return [directory]
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if os.path.exists(os.path.join(directory, name, "result.g2o"))]
+
+def analyze_run(directory):
+    """ One row of the summary table.  Correction is how far optimization
+    moved each pose from where it was recorded (data_cp.g2o), drift is the
+    final correction per meter walked, and edge change is how far each
+    odometry edge of the result (between consecutive poses, skipping the
+    orientation dummies) is from its optimized poses.  Runs whose poses are
+    joined through their dummies (Dummy_Poses_1) have next to no odometry
+    edges, so edge change is left out unless they join at least half the
+    poses.  A run that can't be read gets its error instead. """
+
+    start = time.time()
+    row = {'run': os.path.basename(os.path.normpath(directory))}
+    try:
+        result = load_g2o(os.path.join(directory, "result.g2o"))
+        row['poses'] = len(pose_rows(result))
+        row['tags'] = len(tag_rows(result))
+
+        change = edge_corrections(result)['translation']
+        row['odometry_edges'] = len(change)
+        if len(change) and 2 * len(change) >= row['poses']:
+            row['edge_change_mean_m'] = float(change.mean())
+            row['edge_change_max_m'] = float(change.max())
+
+        data_path = os.path.join(directory, "data_cp.g2o")
+        if os.path.exists(data_path) and row['poses']:
+            corrections = pose_corrections(result, load_g2o(data_path))
+            correction = corrections['translation']
+            path_m = corrections['path_length']
+            row.update(path_m=path_m,
+                       correction_mean_m=float(correction.mean()),
+                       correction_max_m=float(correction.max()),
+                       correction_final_m=float(correction[-1]),
+                       drift_percent=100 * float(correction[-1]) / path_m if path_m else None,
+                       yaw_correction_max_deg=float(np.degrees(np.abs(corrections['yaw']).max())))
+    except (IOError, OSError, ValueError, KeyError) as e:
+        row['error'] = str(e)
+    row['seconds'] = time.time() - start
+    return row
+
+def analyze_runs(directories, processes=None):
+    """ analyze_run over every directory, in a pool of processes (one per
+    core by default), returned in the order given. """
+
+    if processes == 1:
+        return [analyze_run(directory) for directory in directories]
+    pool = Pool(processes)
+    try:
+        return pool.map(analyze_run, directories, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def format_table(rows, columns=COLUMNS):
+    """ rows as a fixed width text table, - for values a run doesn't have. """
+
+    cells = [[name for name, _ in columns]]
+    for row in rows:
+        cells.append([fmt % row[name] if row.get(name) is not None else '-'
+                      for name, fmt in columns])
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    lines = ["  ".join(cell.ljust(width) if i == 0 else cell.rjust(width)
+                       for i, (cell, width) in enumerate(zip(line, widths)))
+             for line in cells]
+    for row in rows:
+        if 'error' in row:
+            lines.append("%s: %s" % (row['run'], row['error']))
+    return "\n".join(lines)
+
+def write_csv(path, rows, columns=COLUMNS):
+    names = [name for name, _ in columns] + ['error']
+    with open(path, 'w') as csv_file:
+        writer = csv.DictWriter(csv_file, names, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Drift and correction statistics of many g2o runs.")
+    parser.add_argument("directory", nargs="+", help="run directories, or directories of runs")
+    parser.add_argument("--processes", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--csv", help="also write the table as CSV")
+    args = parser.parse_args()
+    directories = [run for directory in args.directory for run in find_runs(directory)]
+    start = time.time()
+    rows = analyze_runs(directories, args.processes)
+    print(format_table(rows))
+    print("%i runs in %.1f s" % (len(rows), time.time() - start))
+    if args.csv:
+        write_csv(args.csv, rows)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+try:
+    import tracemalloc
+except ImportError:         # python 2 has no allocation tracing
+    tracemalloc = None
+try:
+    import resource
+except ImportError:         # not on windows
+    resource = None
+import se3
+from g2o_graph import FIRST_POSE_ID, isin, load_g2o, load_naive
+from g2o_metrics import edge_corrections, placed_naive, pose_rows, tag_rows
+from pose_graph_optimizer import PoseGraphOptimizer
+
+#   Times each step of the g2o analysis pipeline on every recorded run under
+#   NavData and writes the timings as JSON, so that a change can be checked
+#   against the report of an earlier one.  Each run is benchmarked on a
+#   temporary copy of its files, so the .npz sidecars load_g2o caches are
+#   never left in NavData.
+
+NAVDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "NavData")
+
+#   A step counts as a regression when it gets this much slower than in the
+#   baseline report.
+SLOWDOWN = 1.25
+
+#   How peak_mb is measured: the peak of the step's own allocations where
+#   tracemalloc exists, else the process's peak resident size after the step,
+#   which only grows, so a step shows up only when it sets a new peak.
+MEMORY = 'tracemalloc' if tracemalloc is not None else 'ru_maxrss' if resource is not None else None
+
+def max_rss():
+    """ Peak resident size of this process so far in MB.  ru_maxrss is in
+    kilobytes, except on macOS where it is in bytes. """
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1e6 if sys.platform == 'darwin' else rss / 1e3
+
+def datasets(root=NAVDATA):
+    """ (name, directory) of every run directory with g2o files: NavData
+    itself and each of its savedwaypoints runs. """
+
+    saved = os.path.join(root, "savedwaypoints")
+    candidates = [("NavData", root)] + [(name, os.path.join(saved, name))
+                                        for name in sorted(os.listdir(saved))]
+    found = []
+    for name, directory in candidates:
+        if os.path.isdir(directory) and any(f.endswith(".g2o") for f in os.listdir(directory)):
+            found.append((name, directory))
+    return found
+
+def measure(step, repeat):
+    """ Runs step once for its peak memory, measured as MEMORY says, then
+    repeat times for the timings.  Returns step's result and the timings. """
+
+    gc.collect()
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        step()
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    elif resource is not None:
+        step()
+        peak = max_rss()
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        result = step()
+        times.append(time.time() - start)
+    return result, {'best_s': min(times), 'mean_s': sum(times) / len(times), 'peak_mb': peak}
+
+def plot_data(result, data, naive=None):
+    """ What G2O_Error_Viz works out before plotting: the optimized and raw
+    trajectories, tag positions, every tag detection placed from its raw
+    pose, and the naive test run placed from the origin tag. """
+
+    rows = pose_rows(result)
+    vertex_ids = result.vertex_ids[rows]
+    trajectory = result.poses[rows]
+    tags = result.poses[tag_rows(result)]
+    raw_trajectory = data.poses[data.index_of(vertex_ids)]
+
+    from_ids, to_ids = result.edge_ids.T
+    kept = (to_ids < FIRST_POSE_ID) & isin(from_ids, vertex_ids)
+    detections = se3.compose(raw_trajectory[np.searchsorted(vertex_ids, from_ids[kept])],
+                             result.measurements[kept])
+    placed = placed_naive(result, naive) if naive is not None else None
+    return trajectory, raw_trajectory, tags, detections, placed
+
+def benchmark_run(directory, repeat=3):
+    """ Timings of every step on a copy of one run directory's g2o files and
+    naive.txt, removed afterwards. """
+
+    work = tempfile.mkdtemp(prefix="g2o_benchmark")
+    try:
+        for name in os.listdir(directory):
+            if name.endswith(".g2o") or name == "naive.txt":
+                shutil.copy(os.path.join(directory, name), work)
+        return _benchmark_copy(work, repeat)
+    finally:
+        shutil.rmtree(work)
+
+def _benchmark_copy(directory, repeat):
+    files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".g2o"))
+    result_path = os.path.join(directory, "result.g2o")
+    data_path = os.path.join(directory, "data_cp.g2o")
+    naive_path = os.path.join(directory, "naive.txt")
+    report = {'files': [os.path.basename(f) for f in files],
+              'bytes': sum(os.path.getsize(f) for f in files)}
+
+    _, report['parse'] = measure(lambda: [load_g2o(f, cache=False) for f in files], repeat)
+    [load_g2o(f) for f in files]
+    _, report['parse_cached'] = measure(lambda: [load_g2o(f) for f in files], repeat)
+
+    result = load_g2o(result_path) if os.path.exists(result_path) else None
+    data = load_g2o(data_path) if os.path.exists(data_path) else None
+    naive = load_naive(naive_path) if os.path.exists(naive_path) else None
+    graph = data if data is not None else result
+    report['vertices'] = len(graph.vertex_ids)
+    report['edges'] = len(graph.edge_ids)
+
+    if result is not None:
+        _, report['edge_differences'] = measure(lambda: edge_corrections(result), repeat)
+    if result is not None and data is not None:
+        _, report['plot_data'] = measure(lambda: plot_data(result, data, naive), repeat)
+
+    def optimize():
+        optimizer = PoseGraphOptimizer(graph)
+        before = optimizer.chi2()
+        optimizer.optimize()
+        return before, optimizer.chi2()
+    (report['chi2_before'], report['chi2_after']), report['optimize'] = measure(optimize, repeat)
+    return report
+
+def benchmark(root=NAVDATA, repeat=3, names=None):
+    report = {'python': platform.python_version(), 'numpy': np.__version__,
+              'repeat': repeat, 'memory': MEMORY, 'datasets': {}}
+    for name, directory in datasets(root):
+        if names and name not in names:
+            continue
+        start = time.time()
+        report['datasets'][name] = benchmark_run(directory, repeat)
+        print("%-40s %6.2f s" % (name, time.time() - start))
+    return report
+
+def regressions(baseline, report, slowdown=SLOWDOWN):
+    """ (dataset, step, old, new) for each step that is more than slowdown
+    times slower than in the baseline report, comparing best times. """
+
+    slower = []
+    for name, run in sorted(report['datasets'].items()):
+        old_run = baseline['datasets'].get(name, {})
+        for step, timing in sorted(run.items()):
+            if isinstance(timing, dict) and isinstance(old_run.get(step), dict):
+                old, new = old_run[step]['best_s'], timing['best_s']
+                if new > old * slowdown:
+                    slower.append((name, step, old, new))
+    return slower
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Times the g2o analysis steps on every NavData run.")
+    parser.add_argument("report", help="where to write the JSON report")
+    parser.add_argument("--baseline", help="earlier report to check for regressions against")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of each step")
+    parser.add_argument("--dataset", action="append", help="only benchmark this run (repeatable)")
+    args = parser.parse_args()
+    report = benchmark(repeat=args.repeat, names=args.dataset)
+    with open(args.report, 'w') as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            slower = regressions(json.load(baseline_file), report)
+        for name, step, old, new in slower:
+            print("REGRESSION %s %s: %.4f s -> %.4f s" % (name, step, old, new))
+        sys.exit(1 if slower else 0)
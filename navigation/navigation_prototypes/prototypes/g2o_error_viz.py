@@ -11,103 +11,70 @@ from os import path
 #import rospy
 #import os
 #import re
-import tf#.transformations import euler_from_quaternion as efq
 from rospkg import RosPack
-#from tf#.transformations import quaternion_from_euler as qfe
-from mobility_games.utils.helper_functions import convert_pose_inverse_transform, convert_translation_rotation_to_pose, invert_transform_2
+import se3
+from g2o_graph import FIRST_POSE_ID, isin, load_g2o, load_naive
+from g2o_metrics import origin_tag, placed_naive, pose_rows, tag_rows
 
 class G2O_Error_Viz:
     def __init__(self, g2o_result_path, g2o_data_path, test_path, manual_rotation):
         top = RosPack().get_path("navigation_prototypes")
-        self.vertices = {}
-        self.old_vertices = {}
-        self.old_edges = {}
+        self.vertex_ids = None
+        self.vertices = None
+        self.old_vertices = None
+        self.old_edge_ids = None
+        self.old_edges = None
         self.new_edges = {}
         self.old_AR = {}
-        self.new_AR = {}
+        self.AR_ids = None
+        self.new_AR = None
         self.transdifference = []
         self.rotdifference = []
-        self.AR_Edges = {}
-        self.dummyidlist = []
+        self.AR_Edges = None
+        self.dummyidlist = None
         self.g2o_result_path = path.join(top, g2o_result_path)
         self.g2o_data_path = path.join(top, g2o_data_path)
-        self.testlist = []
-        self.test_traj = []
+        self.testlist = None
+        self.test_traj = None
         self.test_path = path.join(top, test_path)
         self.origin_info = None
         self.manual_rotation = manual_rotation
         #self.
     def GatherData(self):
-        self.vertices = {}
-        self.old_edges = {}
-        self.old_vertices = {}
-        self.testlist = []
-        origin_tag = None
-        with open(self.g2o_result_path, 'rb') as g2o_result:
-            for line in g2o_result:
-                if line.startswith("FIX "):
-                    line = line.strip()
-                    line = line.split(' ')
-                    dummyid = int(line[1])
-                    if dummyid >= 587:
-                        self.dummyidlist.append(dummyid)
-                    else:
-                        origin_tag = dummyid
-        with open(self.g2o_result_path, 'rb') as g2o_result:
-            for line in g2o_result:
-                if line.startswith("VERTEX_SE3:QUAT "):
-                    line = line.strip()
-                    line = line.split(' ')
-                    line = [float(i) for i in line[1:]]
-                    if not line[0] in self.dummyidlist:
-                        if line[0] == origin_tag:
-                            self.origin_info = (tuple(line[1:4]), tuple(line[4:8]))
-                        if line[0] >= 587:
-                            self.vertices[int(line[0])] = (tuple(line[1:4]), tuple(line[4:8]))
-                            #print("found vertex: " + str(line[0]))
-                        else:
-                            self.new_AR[int(line[0])] = (tuple(line[1:4]), tuple(line[4:8]))
-                            print("found tag: " + str(line[0]))
-                elif line.startswith("EDGE_SE3:QUAT "):
-                    line = line.strip()
-                    line = line.split(' ')
-                    line = [float(i) for i in line[1:]]
-                    if not line[1] in self.dummyidlist:
-                        if int(line[0]) + 2 == int(line[1]):
-                            self.old_edges[int(line[0])] = (tuple(line[2:5]), tuple(line[5:9]))
-                            print("found edge: " + str(line[0]))
-                        else:
-                            self.AR_Edges[int(line[0])] = (line[1], tuple(line[2:5]), tuple(line[5:9]))
-        with open(self.g2o_data_path, 'rb') as g2o_data:
-            for line in g2o_data:
-                if line.startswith("VERTEX_SE3:QUAT "):
-                    line = line.strip()
-                    line = line.split(' ')
-                    line = [float(i) for i in line[1:]]
-                    if line[0] >= 587:
-                        self.old_vertices[int(line[0])] = (tuple(line[1:4]), tuple(line[4:8]))
-                        #print("found vertex: " + str(line[0]))
-                    #else:
-                    #    self.old_AR[int(line[0])] = (tuple(line[1:4]), tuple(line[4:8]))
-                    #    print("found tag: " + str(line[0]))
-        with open(self.test_path, 'rb') as test_data:
-            for line in test_data:
-                if line.startswith("TAG "):
-                    line = line.strip()
-                    line = [float(i) for i in line.split(' ')[1:]]
-                    transrot = (line[0:3], line[3:])
-                    rotation = ((0,0,0),tf.transformations.quaternion_from_euler(*self.manual_rotation))
-                    origin_rotated = self.MultiplyTransform(self.origin_info, rotation)
-                    matres = self.MultiplyTransform(origin_rotated, transrot)
-                    self.testlist.append(np.hstack((matres[0], matres[1])))
-                elif line.startswith("PATH "):
-                    line = line.strip()
-                    line = [float(i) for i in line.split(' ')[1:]]
-                    transrot = (line[0:3], line[3:])
-                    rotation = ((0,0,0),tf.transformations.quaternion_from_euler(*self.manual_rotation))
-                    origin_rotated = self.MultiplyTransform(self.origin_info, rotation)
-                    matres = self.MultiplyTransform(origin_rotated, transrot)
-                    self.test_traj.append(np.hstack((matres[0], matres[1])))
+        result = load_g2o(self.g2o_result_path)
+        data = load_g2o(self.g2o_data_path)
+
+        #   FIX ids at or above the first pose id are orientation dummies, the
+        #   last one below it in the file is the origin tag.
+        fixed = result.fixed_ids
+        self.dummyidlist = fixed[fixed >= FIRST_POSE_ID]
+        origin_id = origin_tag(result)
+
+        poses = pose_rows(result)
+        tags = tag_rows(result)
+        self.vertex_ids = result.vertex_ids[poses]
+        self.vertices = result.poses[poses]
+        self.AR_ids = result.vertex_ids[tags]
+        self.new_AR = result.poses[tags]
+        if origin_id is not None:
+            origin = result.poses[result.index_of([origin_id])[0]]
+            self.origin_info = origin
+        print("found %i vertices and %i tags" % (len(self.vertex_ids), len(self.AR_ids)))
+
+        #   Edges to the next pose are odometry, the rest connect a pose to a tag.
+        from_ids, to_ids = result.edge_ids.T
+        kept = ~isin(to_ids, self.dummyidlist)
+        odometry = kept & (from_ids + 2 == to_ids)
+        self.old_edge_ids = from_ids[odometry]
+        self.old_edges = result.measurements[odometry]
+        self.AR_Edges = (from_ids[kept & ~odometry],
+                         to_ids[kept & ~odometry],
+                         result.measurements[kept & ~odometry])
+        print("found %i edges" % len(self.old_edge_ids))
+
+        self.old_vertices = data.poses[data.index_of(self.vertex_ids)]
+
+        self.testlist, self.test_traj = placed_naive(result, load_naive(self.test_path), self.manual_rotation)
 
     """def CalculateNewEdges(self):
         self.new_edges = {}
@@ -195,42 +162,18 @@ class G2O_Error_Viz:
             self.rotdifference.append(rotdiff)
             ind += 1
             i += 1"""
-    def MultiplyTransform(self, tr1, tr2):
-        T = tf.transformations.quaternion_matrix(tr1[1])
-        T[:-1, -1] = np.squeeze(np.asarray(tr1[0]))
-
-        T2 = tf.transformations.quaternion_matrix(tr2[1])
-        T2[:-1, -1] = np.squeeze(np.asarray(tr2[0]))
-
-        Tres = np.matmul(T, T2)
-        trans = tf.transformations.translation_from_matrix(Tres)
-        rot = tf.transformations.quaternion_from_matrix(Tres)
-
-        return (trans, rot)
-
     def run(self):
         self.GatherData()
         #self.CalculateNewEdges()
-        ordered_vertices = []
-        old_ordered_vertices = []
-
-        for key in sorted(self.vertices):
-            ordered_vertices.append(self.vertices[key][0])
-            old_ordered_vertices.append(self.old_vertices[key][0])
-        traj_data = np.asarray(ordered_vertices)
-        old_traj_data = np.asarray(old_ordered_vertices)
-        test_traj_data = np.asarray(self.test_traj)#np.asarray(self.testlist)
-        for i in self.AR_Edges.items():
-            tag_id = int(i[1][0])
-            pose_id = int(i[0])
-            detections = self.old_AR.get(tag_id, -1)
-            if detections == -1:
-                detections = [self.MultiplyTransform(self.old_vertices[pose_id], i[1][1:])]
-            else:
-                res = self.MultiplyTransform(self.old_vertices[pose_id], i[1][1:])
-                detections.append(res)
-            self.old_AR[tag_id] = detections
-        test_AR = np.asarray(self.testlist)
+        traj_data = self.vertices[:, 0:3]
+        old_traj_data = self.old_vertices[:, 0:3]
+        test_traj_data = self.test_traj#self.testlist
+        pose_ids, tag_ids, measurements = self.AR_Edges
+        pose_rows = np.searchsorted(self.vertex_ids, pose_ids)
+        detections = se3.compose(self.old_vertices[pose_rows], measurements)
+        for tag_id in np.unique(tag_ids).tolist():
+            self.old_AR[tag_id] = detections[tag_ids == tag_id]
+        test_AR = self.testlist
         #print self.old_AR
         #self.CalculateDifference()
         #print("final info: ")
@@ -249,10 +192,9 @@ class G2O_Error_Viz:
                 print(("tag_%i: %s") % (tag[0], point))
                 plt.plot((point[0],), (point[1],), (point[2],), 'ro')
                 ax.text(point[0], point[1], point[2], tag[0])"""
-        for tag in self.new_AR.items():
-            point = tag[1][0]
+        for tag_id, point in zip(self.AR_ids.tolist(), self.new_AR):
             plt.plot((point[0],), (point[1],), (point[2],), 'bo')
-            ax.text(point[0], point[1], point[2], tag[0])
+            ax.text(point[0], point[1], point[2], tag_id)
         test_tags, = plt.plot(test_AR[:,0], test_AR[:,1], test_AR[:,2], 'mo', label = 'naive Test Tags')
         print(np.shape(traj_data))
         new_path, = plt.plot(traj_data[:,0], traj_data[:,1], traj_data[:,2], 'b-', label = 'corrected trajectory')
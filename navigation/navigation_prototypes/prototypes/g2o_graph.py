@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import numpy as np
+
+#   Ids below this are AR tag vertices, ids at or above it are phone poses
+#   (and their orientation dummies).  ArWaypointTest starts numbering here.
+FIRST_POSE_ID = 587
+
+VERTEX_TAG = "VERTEX_SE3:QUAT"
+EDGE_TAG = "EDGE_SE3:QUAT"
+FIX_TAG = "FIX"
+
+#   Parsed files are cached next to the source as <file>.npz, keyed by the
+#   source size and modification time.  Bump this when the layout changes.
+SIDECAR_SUFFIX = ".npz"
+SIDECAR_VERSION = 2
+
+VERTEX_FORMAT = VERTEX_TAG + " %i" + " %f" * 7 + "\n"
+EDGE_FORMAT = EDGE_TAG + " %i %i" + " %f" * 28 + "\n"
+FIX_FORMAT = FIX_TAG + " %i\n"
+
+#   Positions of the diagonal inside the 21 value upper triangle of an
+#   EDGE_SE3:QUAT information matrix.
+INFORMATION_DIAGONAL = (0, 6, 11, 15, 18, 20)
+
+class G2OGraph(object):
+    """ Columnar view of a g2o SE3 pose graph.  Vertex and edge data are kept
+    in parallel numpy arrays in the order they appear in the file. """
+
+    def __init__(self, vertex_ids, translations, quaternions,
+                 edge_ids, measurements, information, fixed_ids):
+        self.vertex_ids = vertex_ids        # (N,) vertex ids
+        self.translations = translations    # (N, 3) x y z
+        self.quaternions = quaternions      # (N, 4) qx qy qz qw
+        self.edge_ids = edge_ids            # (M, 2) from/to vertex ids
+        self.measurements = measurements    # (M, 7) x y z qx qy qz qw
+        self.information = information      # (M, 21) upper triangle, row major
+        self.fixed_ids = fixed_ids          # (K,) FIX ids in file order
+        self._order = None
+
+    @property
+    def fixed(self):
+        """ Set of the vertex ids that g2o holds fixed. """
+
+        return set(self.fixed_ids.tolist())
+
+    @property
+    def poses(self):
+        """ (N, 7) array of every vertex as x y z qx qy qz qw. """
+
+        return np.hstack((self.translations, self.quaternions))
+
+    def index_of(self, ids):
+        """ Returns the row of each vertex id in ids.  Raises KeyError if one
+        of them is not a vertex of this graph. """
+
+        if self._order is None:
+            self._order = np.argsort(self.vertex_ids, kind="mergesort")
+        ids = np.asarray(ids, dtype=np.int64)
+        sorted_ids = self.vertex_ids[self._order]
+        pos = np.searchsorted(sorted_ids, ids)
+        pos = np.clip(pos, 0, max(len(sorted_ids) - 1, 0))
+        if not len(sorted_ids) or np.any(sorted_ids[pos] != ids):
+            missing = np.setdiff1d(ids, self.vertex_ids)
+            raise KeyError("vertices not in graph: %s" % missing[:10].tolist())
+        return self._order[pos]
+
+def information_upper(matrix):
+    """ The 21 values g2o stores for a 6x6 information matrix over
+    x y z qx qy qz: its upper triangle, row by row. """
+
+    return np.asarray(matrix, dtype=float)[np.triu_indices(6)]
+
+def information_diagonal(values):
+    """ Upper triangle of a diagonal information matrix. """
+
+    upper = np.zeros(21)
+    upper[list(INFORMATION_DIAGONAL)] = values
+    return upper
+
+def format_rows(fmt, rows):
+    """ Formats every row of a 2d array with one record format string in a
+    single % operation. """
+
+    rows = np.asarray(rows)
+    return (fmt * len(rows)) % tuple(rows.ravel().tolist())
+
+def isin(ids, candidates):
+    """ Boolean mask of which entries of ids appear in candidates. """
+
+    candidates = np.unique(candidates)
+    ids = np.asarray(ids)
+    if not len(candidates):
+        return np.zeros(ids.shape, dtype=bool)
+    pos = np.clip(np.searchsorted(candidates, ids), 0, len(candidates) - 1)
+    return candidates[pos] == ids
+
+def _parse_rows(lines, width, path, record):
+    """ Converts the numeric part of a list of lines into a (len(lines), width)
+    float array with a single call into numpy. """
+
+    if not lines:
+        return np.zeros((0, width))
+    values = np.fromstring(" ".join(lines), sep=" ")
+    if values.size != len(lines) * width:
+        for number, line in enumerate(lines):
+            if len(line.split()) != width:
+                raise ValueError("%s: malformed %s record %i: %r"
+                                 % (path, record, number, line))
+    return values.reshape(len(lines), width)
+
+def source_key(path):
+    """ Identifies the current contents of path for the sidecar cache. """
+
+    stat = os.stat(path)
+    return np.array([SIDECAR_VERSION, stat.st_size, stat.st_mtime])
+
+def read_sidecar(path):
+    """ Returns the arrays cached for path as a dict, or None if there is no
+    sidecar or it was written for a different version of the file. """
+
+    try:
+        with np.load(path + SIDECAR_SUFFIX) as sidecar:
+            if not np.array_equal(sidecar["source_key"], source_key(path)):
+                return None
+            return dict((name, sidecar[name]) for name in sidecar.files)
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+
+def write_sidecar(path, key, arrays):
+    """ Caches arrays parsed from path, where key is the source_key taken
+    before path was read.  The sidecar is written to a temporary
+    file and renamed into place so readers never see a partial file.  Failing
+    to write (e.g. a read-only directory) only costs the cache. """
+
+    directory, name = os.path.split(os.path.abspath(path))
+    try:
+        handle, tmp_path = tempfile.mkstemp(prefix="." + name, dir=directory)
+    except (IOError, OSError):
+        return
+    try:
+        with os.fdopen(handle, 'wb') as tmp_file:
+            np.savez(tmp_file, source_key=key, **arrays)
+        os.rename(tmp_path, path + SIDECAR_SUFFIX)
+    except (IOError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _graph_arrays(graph):
+    return dict(vertex_ids=graph.vertex_ids,
+                translations=graph.translations,
+                quaternions=graph.quaternions,
+                edge_ids=graph.edge_ids,
+                measurements=graph.measurements,
+                information=graph.information,
+                fixed_ids=graph.fixed_ids)
+
+def load_g2o(path, cache=True):
+    """ Reads a .g2o file in a single pass and returns a G2OGraph.  With cache
+    set the parsed arrays are reused from, or saved to, a binary sidecar. """
+
+    if cache:
+        key = source_key(path)
+        arrays = read_sidecar(path)
+        if arrays is not None:
+            return G2OGraph(arrays["vertex_ids"], arrays["translations"],
+                            arrays["quaternions"], arrays["edge_ids"],
+                            arrays["measurements"], arrays["information"],
+                            arrays["fixed_ids"])
+
+    vertex_lines = []
+    edge_lines = []
+    fix_lines = []
+    vertex_start = len(VERTEX_TAG) + 1
+    edge_start = len(EDGE_TAG) + 1
+    fix_start = len(FIX_TAG) + 1
+    with open(path, 'r') as g2o_file:
+        for line in g2o_file:
+            if line.startswith(VERTEX_TAG):
+                vertex_lines.append(line[vertex_start:])
+            elif line.startswith(EDGE_TAG):
+                edge_lines.append(line[edge_start:])
+            elif line.startswith(FIX_TAG):
+                fix_lines.append(line[fix_start:])
+
+    vertices = _parse_rows(vertex_lines, 8, path, VERTEX_TAG)
+    edges = _parse_rows(edge_lines, 30, path, EDGE_TAG)
+    if fix_lines:
+        fixed = np.fromstring(" ".join(fix_lines), sep=" ").astype(np.int64)
+    else:
+        fixed = np.zeros(0, dtype=np.int64)
+
+    graph = G2OGraph(vertices[:, 0].astype(np.int64),
+                     vertices[:, 1:4],
+                     vertices[:, 4:8],
+                     edges[:, 0:2].astype(np.int64),
+                     edges[:, 2:9],
+                     edges[:, 9:30],
+                     fixed)
+    if cache:
+        write_sidecar(path, key, _graph_arrays(graph))
+    return graph
+
+def write_g2o(path, graph):
+    """ Writes a G2OGraph as text g2o can read: vertices, then edges, then
+    FIX lines. """
+
+    vertices = np.hstack((graph.vertex_ids[:, np.newaxis], graph.translations,
+                          graph.quaternions))
+    edges = np.hstack((graph.edge_ids, graph.measurements, graph.information))
+    with open(path, 'w') as g2o_file:
+        g2o_file.write(format_rows(VERTEX_FORMAT, vertices))
+        g2o_file.write(format_rows(EDGE_FORMAT, edges))
+        g2o_file.write(format_rows(FIX_FORMAT, graph.fixed_ids[:, np.newaxis]))
+
+def load_naive(path, cache=True):
+    """ Reads a naive.txt test file written by ArWaypointTest.  Returns the
+    TAG and PATH records as two (N, 7) arrays of x y z qx qy qz qw. """
+
+    if cache:
+        key = source_key(path)
+        arrays = read_sidecar(path)
+        if arrays is not None:
+            return arrays["tags"], arrays["path"]
+
+    tag_lines = []
+    path_lines = []
+    with open(path, 'r') as naive_file:
+        for line in naive_file:
+            if line.startswith("TAG "):
+                tag_lines.append(line[4:])
+            elif line.startswith("PATH "):
+                path_lines.append(line[5:])
+    tags = _parse_rows(tag_lines, 7, path, "TAG")
+    path_records = _parse_rows(path_lines, 7, path, "PATH")
+    if cache:
+        write_sidecar(path, key, dict(tags=tags, path=path_records))
+    return tags, path_records
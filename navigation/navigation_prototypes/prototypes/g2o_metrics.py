@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+import numpy as np
+from scipy.spatial import cKDTree
+import se3
+from g2o_graph import FIRST_POSE_ID, isin
+
+#   Drift and correction metrics of g2o runs as plain arrays and dicts.
+#   Nothing here draws or imports matplotlib; g2o_error_plot.py and
+#   g2o_error_viz.py plot what these compute.
+
+def wrap(angles):
+    """ Angles in radians wrapped into (-pi, pi]. """
+
+    return np.pi - np.mod(np.pi - np.asarray(angles, dtype=float), 2 * np.pi)
+
+def pose_rows(graph):
+    """ Rows of the phone poses of a graph in id order, leaving out the
+    fixed orientation dummies. """
+
+    ids = graph.vertex_ids
+    rows = np.flatnonzero((ids >= FIRST_POSE_ID) & ~isin(ids, graph.fixed_ids))
+    return rows[np.argsort(ids[rows], kind="mergesort")]
+
+def tag_rows(graph):
+    """ Rows of the AR tags of a graph. """
+
+    return np.flatnonzero(graph.vertex_ids < FIRST_POSE_ID)
+
+def edge_corrections(graph):
+    """ How far each odometry edge of an optimized graph is from its
+    optimized poses, as G2O_Viz plots it.  Odometry edges join consecutive
+    phone poses; in graphs with orientation dummies those are id -> id + 2,
+    as each pose's id + 1 is its FIXed dummy.  Returns a dict of from_ids
+    and to_ids, translation (meters) and yaw (radians) per edge. """
+
+    pose_ids = graph.vertex_ids[pose_rows(graph)]
+    from_ids, to_ids = graph.edge_ids.T
+    following = pose_ids[np.minimum(np.searchsorted(pose_ids, from_ids) + 1, max(len(pose_ids) - 1, 0))] \
+        if len(pose_ids) else to_ids + 1
+    odometry = np.flatnonzero(isin(from_ids, pose_ids[:-1]) & ~isin(to_ids, graph.fixed_ids)
+                              & (to_ids == following))
+    odometry = odometry[np.argsort(from_ids[odometry], kind="mergesort")]
+    measured = graph.measurements[odometry]
+    new_edges = se3.relative(graph.poses[graph.index_of(from_ids[odometry])],
+                             graph.poses[graph.index_of(to_ids[odometry])])
+    return {'from_ids': from_ids[odometry], 'to_ids': to_ids[odometry],
+            'translation': np.linalg.norm(new_edges[:, 0:3] - measured[:, 0:3], axis=1),
+            'yaw': wrap(se3.yaw(new_edges[:, 3:7]) - se3.yaw(measured[:, 3:7]))}
+
+def pose_corrections(result, data):
+    """ How far optimization moved each pose of result from where it was
+    recorded in data.  Returns a dict of ids, translation and yaw per pose,
+    and the length of the recorded path. """
+
+    rows = pose_rows(result)
+    ids = result.vertex_ids[rows]
+    optimized = result.poses[rows]
+    raw = data.poses[data.index_of(ids)]
+    return {'ids': ids,
+            'translation': np.linalg.norm(optimized[:, 0:3] - raw[:, 0:3], axis=1),
+            'yaw': wrap(se3.yaw(optimized[:, 3:7]) - se3.yaw(raw[:, 3:7])),
+            'path_length': float(np.sum(np.linalg.norm(np.diff(raw[:, 0:3], axis=0), axis=1)))}
+
+def origin_tag(graph):
+    """ Id of the origin tag: the tag of the last FIX record in the file,
+    or None if no tag is fixed. """
+
+    fixed = graph.fixed_ids
+    origin_tags = fixed[fixed < FIRST_POSE_ID]
+    return int(origin_tags[-1]) if len(origin_tags) else None
+
+def placed_naive(result, naive, rotation=(0, 0, 0)):
+    """ The TAG and PATH records of load_naive placed in the frame of result
+    through its origin tag, turned by rotation (roll, pitch, yaw), as
+    G2O_Error_Viz does.  Returns (tags, path), or None without an origin. """
+
+    origin_id = origin_tag(result)
+    if origin_id is None:
+        return None
+    origin = result.poses[result.index_of([origin_id])[0]]
+    turn = np.hstack(((0, 0, 0), se3.quaternion_from_euler(*rotation)))
+    origin = se3.compose(origin, turn)
+    tags, path = naive
+    return se3.compose(origin, tags), se3.compose(origin, path)
+
+def trajectory_errors(poses, reference, step=10):
+    """ Errors of a trajectory against a reference one recorded separately,
+    e.g. the naive PATH against the optimized poses.  With no times to pair
+    them by, each pose is paired with the nearest reference pose.
+
+    Returns a dict of: indices, the paired reference row of each pose; ate,
+    the distance to it; and rpe, for each pose and the one step after it,
+    how much the distance between them differs from that between their
+    paired reference poses. """
+
+    poses = np.asarray(poses, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    distances, indices = cKDTree(reference[:, 0:3]).query(poses[:, 0:3])
+    moved = np.linalg.norm(poses[step:, 0:3] - poses[:-step, 0:3], axis=1)
+    paired = reference[indices]
+    paired_moved = np.linalg.norm(paired[step:, 0:3] - paired[:-step, 0:3], axis=1)
+    return {'indices': indices, 'ate': distances, 'rpe': np.abs(moved - paired_moved)}
+
+def tag_residuals(graph):
+    """ For each tag, how far each of its detections, placed from the pose
+    that saw it, is from the tag's optimized position.  Returns
+    {tag_id: residuals in meters}. """
+
+    from_ids, to_ids = graph.edge_ids.T
+    detections = np.flatnonzero((from_ids >= FIRST_POSE_ID) & (to_ids < FIRST_POSE_ID)
+                                & isin(to_ids, graph.vertex_ids))
+    placed = se3.compose(graph.poses[graph.index_of(from_ids[detections])],
+                         graph.measurements[detections])
+    tags = graph.poses[graph.index_of(to_ids[detections])]
+    residuals = np.linalg.norm(placed[:, 0:3] - tags[:, 0:3], axis=1)
+    tag_ids = to_ids[detections]
+    return dict((tag_id, residuals[tag_ids == tag_id]) for tag_id in np.unique(tag_ids).tolist())
+
+def summary(values):
+    """ count, mean, rms and max of an array of errors. """
+
+    values = np.abs(np.asarray(values, dtype=float))
+    if not len(values):
+        return {'count': 0}
+    return {'count': len(values), 'mean': float(values.mean()),
+            'rms': float(np.sqrt(np.mean(values * values))), 'max': float(values.max())}
+
+if __name__ == "__main__":
+    import sys
+    import json
+    from g2o_graph import load_g2o, load_naive
+    if len(sys.argv) < 2:
+        print("usage: g2o_metrics.py result.g2o [data.g2o [naive.txt]]")
+        sys.exit(1)
+    result = load_g2o(sys.argv[1])
+    metrics = {'edge_translation': summary(edge_corrections(result)['translation']),
+               'tag_residuals': dict((str(tag), summary(residuals)) for tag, residuals
+                                     in tag_residuals(result).items())}
+    if len(sys.argv) > 2:
+        corrections = pose_corrections(result, load_g2o(sys.argv[2]))
+        metrics['pose_translation'] = summary(corrections['translation'])
+        metrics['path_length'] = corrections['path_length']
+    if len(sys.argv) > 3:
+        placed = placed_naive(result, load_naive(sys.argv[3]))
+        if placed is not None:
+            errors = trajectory_errors(placed[1], result.poses[pose_rows(result)])
+            metrics['naive_ate'] = summary(errors['ate'])
+            metrics['naive_rpe'] = summary(errors['rpe'])
+    print(json.dumps(metrics, indent=2, sort_keys=True))
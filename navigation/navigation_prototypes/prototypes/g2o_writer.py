@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+import threading
+import numpy as np
+from g2o_graph import VERTEX_FORMAT, EDGE_FORMAT, FIX_FORMAT, G2OGraph, format_rows
+
+class G2OWriter(object):
+    """ Records g2o vertices, edges and FIX lines into preallocated arrays and
+    appends them to a file from a background thread, so callers never wait
+    on disk I/O.
+
+    Records are handed to the writer thread in batches.  Each batch is
+    written as its vertices, then its edges, then its FIX lines; since a
+    batch holds everything added since the previous one, every edge lands
+    in the file after the vertices it connects.  Batches are also kept in
+    memory so the recorded graph can be optimized without reading the file
+    back.  If mirror is given (e.g. an IncrementalOptimizer) every record is
+    also passed on to its add_vertex / add_edge / add_fix. """
+
+    def __init__(self, path, batch_size=512, mode='w', mirror=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.mirror = mirror
+        self._file = open(path, mode)
+        self._condition = threading.Condition()
+        self._pending = []          # Full batches waiting for the writer thread.
+        self._batches = []          # Every batch queued so far, for graph().
+        self._batches_queued = 0
+        self._batches_written = 0
+        self._closed = False
+        self._error = None
+        self._new_buffers()
+        self._thread = threading.Thread(target=self._write_loop, name="g2o_writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _new_buffers(self):
+        self._vertices = np.empty((self.batch_size, 8))     # id x y z qx qy qz qw
+        self._edges = np.empty((self.batch_size, 30))       # ids, measurement, information
+        self._fixed = np.empty((self.batch_size, 1))
+        self._vertex_count = 0
+        self._edge_count = 0
+        self._fix_count = 0
+
+    def add_vertex(self, vertex_id, trans, rot):
+        """ Adds a VERTEX_SE3:QUAT record. """
+
+        with self._condition:
+            self._check_open()
+            row = self._vertices[self._vertex_count]
+            row[0] = vertex_id
+            row[1:4] = trans
+            row[4:8] = rot
+            self._vertex_count += 1
+            self._queue_if_full()
+        if self.mirror is not None:
+            self.mirror.add_vertex(vertex_id, trans, rot)
+
+    def add_edge(self, from_id, to_id, trans, rot, information):
+        """ Adds an EDGE_SE3:QUAT record.  information is the 21 value upper
+        triangle of the edge's information matrix. """
+
+        with self._condition:
+            self._check_open()
+            row = self._edges[self._edge_count]
+            row[0] = from_id
+            row[1] = to_id
+            row[2:5] = trans
+            row[5:9] = rot
+            row[9:30] = information
+            self._edge_count += 1
+            self._queue_if_full()
+        if self.mirror is not None:
+            self.mirror.add_edge(from_id, to_id, trans, rot, information)
+
+    def add_fix(self, vertex_id):
+        """ Adds a FIX record holding vertex_id in place. """
+
+        with self._condition:
+            self._check_open()
+            self._fixed[self._fix_count] = vertex_id
+            self._fix_count += 1
+            self._queue_if_full()
+        if self.mirror is not None:
+            self.mirror.add_fix(vertex_id)
+
+    def _check_open(self):
+        if self._closed:
+            raise ValueError("write to closed G2OWriter for %s" % self.path)
+
+    def _queue_if_full(self):
+        if self.batch_size in (self._vertex_count, self._edge_count, self._fix_count):
+            self._queue_batch()
+
+    def _queue_batch(self):
+        """ Hands the current buffers to the writer thread.  Caller holds the
+        condition. """
+
+        if self._vertex_count or self._edge_count or self._fix_count:
+            batch = (self._vertices[:self._vertex_count],
+                     self._edges[:self._edge_count],
+                     self._fixed[:self._fix_count])
+            self._pending.append(batch)
+            self._batches.append(batch)
+            self._batches_queued += 1
+            self._new_buffers()
+            self._condition.notify_all()
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                vertices, edges, fixed = self._pending.pop(0)
+            try:
+                self._file.write(format_rows(VERTEX_FORMAT, vertices)
+                                 + format_rows(EDGE_FORMAT, edges)
+                                 + format_rows(FIX_FORMAT, fixed))
+                self._file.flush()
+            except (IOError, OSError) as e:
+                self._error = e
+            with self._condition:
+                self._batches_written += 1
+                self._condition.notify_all()
+
+    def graph(self):
+        """ G2OGraph of everything added so far, as it will appear in the
+        file. """
+
+        with self._condition:
+            batches = self._batches + [(self._vertices[:self._vertex_count].copy(),
+                                        self._edges[:self._edge_count].copy(),
+                                        self._fixed[:self._fix_count].copy())]
+        vertices = np.vstack([batch[0] for batch in batches])
+        edges = np.vstack([batch[1] for batch in batches])
+        fixed = np.vstack([batch[2] for batch in batches])
+        return G2OGraph(vertices[:, 0].astype(np.int64), vertices[:, 1:4],
+                        vertices[:, 4:8], edges[:, 0:2].astype(np.int64),
+                        edges[:, 2:9], edges[:, 9:30],
+                        fixed.ravel().astype(np.int64))
+
+    def flush(self):
+        """ Blocks until everything added so far is in the file. """
+
+        with self._condition:
+            self._queue_batch()
+            target = self._batches_queued
+            while self._batches_written < target:
+                self._condition.wait()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def close(self):
+        """ Writes out the remaining records and closes the file.  Safe to
+        call more than once, e.g. from a ROS shutdown hook.  Raises, once the
+        file is closed, any error writing it that flush has not raised yet. """
+
+        with self._condition:
+            if self._closed:
+                return
+            self._queue_batch()
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._file.close()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
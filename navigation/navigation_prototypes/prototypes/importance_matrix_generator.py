@@ -8,11 +8,12 @@ import matplotlib.animation as animation
 import matplotlib.patches as mpatches
 #import math
 import rospy
-from os import system
 #import re
 import tf#.transformations import euler_from_quaternion as efq
 #from tf#.transformations import quaternion_from_euler as qfe
 from mobility_games.utils.helper_functions import convert_pose_inverse_transform, convert_translation_rotation_to_pose, invert_transform_2
+from g2o_graph import FIRST_POSE_ID, INFORMATION_DIAGONAL, load_g2o, write_g2o
+from pose_graph_optimizer import optimize_graph
 
 class Importance_Generator:
     def __init__(self):
@@ -28,9 +29,10 @@ class Importance_Generator:
         self.g2o_result_path = '/home/juicyslew/catkin_ws/result_edited.g2o'
         self.g2o_data_path = '/home/juicyslew/catkin_ws/data_cp.g2o'
         self.g2o_edited_path = '/home/juicyslew/catkin_ws/data_edited.g2o'
-        self.importance_inds = [10, 16, 21, 25, 28, 30]
+        self.importance_inds = list(INFORMATION_DIAGONAL)
         self.importance_val_AR = [100, 100, 100, 100, 100, 100]
         self.importance_val_pose = [1,1,1,1,1,1]
+        self.edited_graph = None
     def Create_Edited_Data(self):
         #self.vertices = {}
         #self.old_edges = {}
@@ -54,41 +56,13 @@ class Importance_Generator:
                     if int(line[0]) + 1 == int(line[1]):
                         self.old_edges[int(line[0])] = (tuple(line[2:5]), tuple(line[5:9]))
                         print("found edge: " + str(line[0]))"""
-        with open(self.g2o_data_path, 'rb') as g2o_data:
-            with open(self.g2o_edited_path, 'wb') as edited_data:
-                for line in g2o_data:
-                    if line.startswith("EDGE_SE3:QUAT "):
-                        line = line.strip()
-                        line = line.split(' ')
-                        if int(line[2]) < 587:
-                            j = 0
-                            for i in self.importance_inds:
-                                line[i] = str(self.importance_val_AR[j])
-                                j+=1
-                        else:
-                            j = 0
-                            for i in self.importance_inds:
-                                line[i] = str(self.importance_val_pose[j])
-                                j+=1
-                        line = (" ").join(line)
-                        line += "\n"
-                        print line
-                        edited_data.write(line)
-                    else:
-                        edited_data.write(line)
-                        #line = [float(i) for i in line[1:]]
-                        """if int(line[0]) + 1 == int(line[1]):
-                            self.old_edges[int(line[0])] = (tuple(line[2:5]), tuple(line[5:9]))
-                            print("found edge: " + str(line[0]))"""
-                        """line = line.strip()
-                        line = line.split(' ')
-                        line = [float(i) for i in line[1:]]
-                    if line[0] >= 587:
-                        self.old_vertices[int(line[0])] = (tuple(line[1:4]), tuple(line[4:8]))
-                        #print("found vertex: " + str(line[0]))
-                    else:
-                        self.old_AR[int(line[0])] = (tuple(line[1:4]), tuple(line[4:8]))
-                        print("found tag: " + str(line[0]))"""
+        graph = load_g2o(self.g2o_data_path)
+        to_tag = graph.edge_ids[:, 1] < FIRST_POSE_ID
+        for ind, val_AR, val_pose in zip(self.importance_inds, self.importance_val_AR, self.importance_val_pose):
+            graph.information[to_tag, ind] = val_AR
+            graph.information[~to_tag, ind] = val_pose
+        write_g2o(self.g2o_edited_path, graph)
+        self.edited_graph = graph
     """def CalculateNewEdges(self):
         self.new_edges = {}
         ind = 587
@@ -176,7 +150,7 @@ class Importance_Generator:
             ind += 1
             i += 1"""
     def execute_g2o(self):
-        system("g2o -o %s %s" % (self.g2o_result_path, self.g2o_edited_path))
+        write_g2o(self.g2o_result_path, optimize_graph(self.edited_graph))
 
 
     def run(self):
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import threading
+import rospy
+from visualization_msgs.msg import Marker, MarkerArray
+
+def same_marker(a, b):
+    """ Whether two markers would draw the same, ignoring their stamps. """
+
+    if a.header.frame_id != b.header.frame_id:
+        return False
+    for field in a.__slots__:
+        if field != 'header' and getattr(a, field) != getattr(b, field):
+            return False
+    return True
+
+class MarkerManager(object):
+    """ Keeps track of the markers published on a MarkerArray topic and
+    publishes only the ones that were added, changed or deleted since the last
+    publish, so a tick where nothing changed sends nothing.  Markers are keyed
+    by (ns, id) like in rviz.  Whenever a new subscriber connects (e.g. rviz
+    is started late) everything is sent again.
+
+    Markers given to set() belong to the manager afterwards; make a new one
+    to change it rather than editing the old one in place. """
+
+    def __init__(self, publisher):
+        self.publisher = publisher
+        self._lock = threading.Lock()
+        self._published = {}    # (ns, id) -> marker
+        self._pending = {}      # (ns, id) -> marker, or None to delete it
+        self._clear = False
+        self._connections = 0
+
+    def set(self, marker):
+        key = (marker.ns, marker.id)
+        with self._lock:
+            published = self._published.get(key)
+            if published is not None and same_marker(published, marker):
+                self._pending.pop(key, None)
+            else:
+                self._pending[key] = marker
+
+    def delete(self, ns, id):
+        key = (ns, id)
+        with self._lock:
+            if key in self._published:
+                self._pending[key] = None
+            else:
+                self._pending.pop(key, None)
+
+    def clear(self):
+        """ Deletes every marker on the topic, including ones from before
+        this manager was made. """
+
+        with self._lock:
+            self._published = {}
+            self._pending = {}
+            self._clear = True
+
+    def publish(self):
+        """ Sends the changes since the last publish, if there are any.
+        Returns whether anything was sent. """
+
+        connections = self.publisher.get_num_connections()
+        with self._lock:
+            markers = []
+            if self._clear:
+                markers.append(Marker(action=Marker.DELETEALL))
+            if connections > self._connections:
+                pending = dict(self._published)
+                pending.update(self._pending)
+                self._pending = pending
+            self._connections = connections
+            now = rospy.Time.now()
+            for key, marker in self._pending.items():
+                if marker is None:
+                    markers.append(Marker(ns=key[0], id=key[1], action=Marker.DELETE))
+                    del self._published[key]
+                else:
+                    marker.header.stamp = now
+                    self._published[key] = marker
+                    markers.append(marker)
+            self._pending = {}
+            self._clear = False
+        if not markers:
+            return False
+        self.publisher.publish(MarkerArray(markers=markers))
+        return True
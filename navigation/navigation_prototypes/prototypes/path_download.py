@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from email.utils import formatdate
+from multiprocessing.pool import ThreadPool
+try:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import quote, urlsplit
+except ImportError:         # python 2
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import quote
+    from urlparse import urlsplit
+from path_store import PathStore, STORE
+from dynamodb_stream import iter_items
+
+#   Fetches the path runs of many users from the DynamoDB API at once and
+#   imports them into a PathStore.  Each worker thread keeps one connection
+#   open, responses are revalidated with the ETag / Last-Modified of the last
+#   download so unchanged users cost an empty 304, and failed requests are
+#   retried.  Responses are decoded as they arrive, a run at a time, so a
+#   worker never holds a whole user's body as text.  StandinServer serves
+#   recorded responses the same way, so this can be tried without the network.
+
+API_URL = "https://27bcct7nyg.execute-api.us-east-1.amazonaws.com/Test/userid/%s"
+
+#   Statuses worth asking again for, after backoff * 2 ** attempt seconds.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class _Recorder(object):
+    """ File-like reading from stream and writing everything read to copy. """
+
+    def __init__(self, stream, copy):
+        self.stream = stream
+        self.copy = copy
+
+    def read(self, size=-1):
+        data = self.stream.read() if size is None or size < 0 else self.stream.read(size)
+        self.copy.write(data)
+        return data
+
+class Downloader(object):
+    """ Downloads users' path data into store.  Validators of earlier
+    downloads are kept in the store directory as downloads.json. """
+
+    def __init__(self, store, url=API_URL, threads=8, retries=3, backoff=0.5,
+                 timeout=30, record=None):
+        self.store = store
+        self.url = url
+        self.threads = threads
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.record = record
+        self.validators_path = os.path.join(store.root, "downloads.json")
+        self.validators = {}
+        if os.path.exists(self.validators_path):
+            with open(self.validators_path, 'r') as validators_file:
+                self.validators = json.load(validators_file)
+        self._local = threading.local()
+
+    def _connection(self, parts):
+        """ This thread's connection to the host of parts, opened on first use. """
+
+        key = (parts.scheme, parts.netloc)
+        if getattr(self._local, 'key', None) != key:
+            self._close()
+            connection_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+            self._local.connection = connection_class(parts.netloc, timeout=self.timeout)
+            self._local.key = key
+        return self._local.connection
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+        self._local.connection = None
+        self._local.key = None
+
+    def _headers(self, user_id):
+        """ Conditional request headers for user_id, if the runs of its last
+        download are still in the store. """
+
+        cached = self.validators.get(user_id)
+        if not cached or cached['runs'] != len(self.store.runs(user_id=user_id)):
+            return {}
+        headers = {}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        return headers
+
+    def fetch(self, user_id, headers=None):
+        """ GETs the data of user_id with the given headers (by default those
+        of _headers), retrying connection errors, bodies that are not a whole
+        DynamoDB response and the statuses in RETRY_STATUSES.  Returns a dict
+        of user_id, status, attempts, the body's items as {'Items': [...]}
+        (for a 200), the response's validators and error (for a failure). """
+
+        parts = urlsplit(self.url % quote(user_id))
+        path = parts.path + ("?" + parts.query if parts.query else "")
+        headers = headers if headers is not None else self._headers(user_id)
+        result = {'user_id': user_id, 'status': None, 'attempts': 0}
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            result['attempts'] = attempt + 1
+            try:
+                connection = self._connection(parts)
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                if response.status == 200:
+                    items = self._items(response, user_id)
+                else:
+                    response.read()
+            except (socket.error, HTTPException) as e:
+                self._close()
+                result['error'] = str(e) or e.__class__.__name__
+                continue
+            except ValueError as e:
+                #   Truncated or malformed; the rest of the body is unread.
+                self._close()
+                result['status'] = response.status
+                result['error'] = "bad response: %s" % e
+                continue
+            result['status'] = response.status
+            if response.getheader('connection', '').lower() == 'close':
+                self._close()
+            if response.status in RETRY_STATUSES:
+                result['error'] = "HTTP %i" % response.status
+                continue
+            result.pop('error', None)
+            if response.status == 200:
+                result['data'] = {u'Items': items}
+                result['etag'] = response.getheader('etag')
+                result['last_modified'] = response.getheader('last-modified')
+            elif response.status != 304:
+                result['error'] = "HTTP %i" % response.status
+            return result
+        return result
+
+    def _items(self, response, user_id):
+        """ The items of a response, streamed through iter_items and also
+        saved to the record directory if there is one.  The rest of the body
+        is read too, so the connection can be used again. """
+
+        if not self.record:
+            items = list(iter_items(response))
+            response.read()
+            return items
+        path = os.path.join(self.record, user_id + ".json")
+        try:
+            with open(path + ".tmp", 'wb') as record_file:
+                recorder = _Recorder(response, record_file)
+                items = list(iter_items(recorder))
+                recorder.read()
+            os.rename(path + ".tmp", path)
+        except:
+            os.remove(path + ".tmp")
+            raise
+        return items
+
+    def download(self, user_ids):
+        """ Fetches every user in the pool and imports what changed into the
+        store, which happens here in the calling thread.  Returns the result
+        of each user as fetch gives it, without the data, plus runs. """
+
+        if self.record and not os.path.isdir(self.record):
+            os.makedirs(self.record)
+        #   Worked out up front, as the store changes while the pool runs.
+        headers = dict((user_id, self._headers(user_id)) for user_id in user_ids)
+        results = {}
+        pool = ThreadPool(self.threads)
+        try:
+            for result in pool.imap_unordered(lambda user_id: self.fetch(user_id, headers[user_id]),
+                                              user_ids):
+                user_id = result['user_id']
+                data = result.pop('data', None)
+                if data is not None:
+                    result['runs'] = len(self.store.import_dump(data, user_id))
+                    self.validators[user_id] = {'etag': result['etag'],
+                                                'last_modified': result['last_modified'],
+                                                'runs': len(self.store.runs(user_id=user_id))}
+                results[user_id] = result
+        finally:
+            pool.close()
+            pool.join()
+            self.save_validators()
+        return results
+
+    def save_validators(self):
+        if not os.path.isdir(self.store.root):
+            os.makedirs(self.store.root)
+        tmp_path = self.validators_path + ".tmp"
+        with open(tmp_path, 'w') as validators_file:
+            json.dump(self.validators, validators_file, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.validators_path)
+
+class _StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        user_id = self.path.rstrip('/').split('/')[-1]
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers.items())))
+            failures = server.failures.get(user_id, 0)
+            if failures:
+                server.failures[user_id] = failures - 1
+        path = os.path.join(server.directory, user_id + ".json")
+        if failures:
+            self._send(503, b"")
+        elif not os.path.exists(path):
+            self._send(200, json.dumps({u'Count': 0, u'Items': []}).encode('utf-8'))
+        else:
+            with open(path, 'rb') as response_file:
+                body = response_file.read()
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            last_modified = formatdate(int(os.path.getmtime(path)), usegmt=True)
+            headers = {'ETag': etag, 'Last-Modified': last_modified}
+            if (self.headers.get('If-None-Match') == etag
+                    or (self.headers.get('If-None-Match') is None
+                        and self.headers.get('If-Modified-Since') == last_modified)):
+                self._send(304, b"", headers)
+            else:
+                self._send(200, body, headers)
+
+    def _send(self, status, body, headers={}):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class StandinServer(ThreadingMixIn, HTTPServer):
+    """ Local stand-in for the DynamoDB API, serving the recorded response
+    <user_id>.json of directory for /userid/<user_id> with an ETag and
+    Last-Modified and answering conditional requests with 304.  failures
+    maps user ids to how many 503s to answer before the response.  Requests
+    are kept in requests as (path, headers). """
+
+    daemon_threads = True
+
+    def __init__(self, directory, port=0, failures=None):
+        HTTPServer.__init__(self, ("127.0.0.1", port), _StandinHandler)
+        self.directory = directory
+        self.failures = dict(failures or {})
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%i/userid/%%s" % self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Downloads many users' path runs into the local store.")
+    parser.add_argument("user_id", nargs="*", help="user ids to download")
+    parser.add_argument("--users", help="file of user ids, one per line")
+    parser.add_argument("--store", default=STORE, help="store directory (default: %(default)s)")
+    parser.add_argument("--url", default=API_URL, help="API URL with %%s for the user id")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent downloads")
+    parser.add_argument("--retries", type=int, default=3, help="retries of a failed request")
+    parser.add_argument("--record", help="also save each response as <user_id>.json here")
+    parser.add_argument("--serve", help="serve the recorded responses of this directory instead")
+    parser.add_argument("--port", type=int, default=8000, help="port to serve on")
+    args = parser.parse_args()
+    if args.serve:
+        server = StandinServer(args.serve, args.port)
+        print("Serving %s at %s" % (args.serve, server.url % "<user_id>"))
+        server.serve_forever()
+    user_ids = list(args.user_id)
+    if args.users:
+        with open(args.users, 'r') as users_file:
+            user_ids += [line.strip() for line in users_file if line.strip()]
+    downloader = Downloader(PathStore(args.store), args.url, args.threads, args.retries,
+                            record=args.record)
+    start = time.time()
+    results = downloader.download(user_ids)
+    for user_id in user_ids:
+        result = results[user_id]
+        if result.get('error'):
+            outcome = result['error']
+        elif result['status'] == 304:
+            outcome = "unchanged"
+        else:
+            outcome = "%i runs" % result['runs']
+        print("%-40s %4s %2i attempts  %s" % (user_id, result['status'], result['attempts'], outcome))
+    print("%i users in %.1f s" % (len(user_ids), time.time() - start))
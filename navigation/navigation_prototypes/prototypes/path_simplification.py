@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+import numpy as np
+from crumb_buffer import CrumbBuffer
+
+def line_distances(points, start, end):
+    """ Distances of points[start:end + 1] from the line through points[start]
+    and points[end].  Works on a view of points, nothing is copied. """
+
+    offsets = points[start:end + 1] - points[start]
+    direction = points[end] - points[start]
+    length = np.sqrt(np.dot(direction, direction))
+    if length == 0:
+        return np.sqrt(np.sum(offsets * offsets, axis=1))
+    unit = direction / length
+    perpendicular = offsets - np.outer(offsets.dot(unit), unit)
+    return np.sqrt(np.sum(perpendicular * perpendicular, axis=1))
+
+def simplify(points, tolerance):
+    """ Ramer-Douglas-Peucker simplification of an (N, 3) path.  Returns the
+    sorted indices of the points to keep, first and last included: every
+    dropped point lies within tolerance of the line between the kept points
+    around it.
+
+    Segments are index ranges on an explicit stack, so long paths neither
+    copy the array nor run into the recursion limit. """
+
+    points = np.asarray(points, dtype=float)
+    count = len(points)
+    if count < 3:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        distances = line_distances(points, start, end)
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            index += start
+            keep[index] = True
+            stack.append((index, end))
+            stack.append((start, index))
+    return np.flatnonzero(keep)
+
+class OnlineSimplifier(object):
+    """ Opening-window simplification of a path that is still being recorded.
+    A window runs from the last keypoint to the newest point; when a point in
+    it strays further than tolerance from the line between the two ends, the
+    point before the newest becomes a keypoint and the window restarts there.
+    Each point costs O(window) rather than a pass over the whole path, and
+    max_window caps that by forcing a keypoint on very long straight runs.
+
+    Every point stays within tolerance of the keypoint path, as with
+    simplify(), but the keypoints chosen are not the same. """
+
+    def __init__(self, tolerance, max_window=200):
+        self.tolerance = tolerance
+        self.max_window = max_window
+        self._keypoints = CrumbBuffer()
+        self._window = CrumbBuffer(capacity=max_window + 1)
+
+    def __len__(self):
+        return len(self._keypoints)
+
+    def add(self, point):
+        """ Adds the next point of the path.  Returns True if that made the
+        previous point a keypoint. """
+
+        if not len(self._keypoints):
+            self._keypoints.append(point)
+            self._window.append(point)
+            return False
+        self._window.append(point)
+        window = self._window.view()
+        end = len(window) - 1
+        if end < 2:
+            return False
+        if end < self.max_window and \
+                np.max(line_distances(window, 0, end)) <= self.tolerance:
+            return False
+        corner = window[end - 1].copy()
+        self._keypoints.append(corner)
+        self._window.clear()
+        self._window.append(corner)
+        self._window.append(point)
+        return True
+
+    def keypoints(self):
+        """ The keypoints so far as a new (N, 3) array, with the newest point
+        as the last one. """
+
+        keypoints = self._keypoints.view()
+        if len(self._window) > 1:
+            keypoints = np.vstack((keypoints, self._window.view()[-1:]))
+        return keypoints.copy()
+
+    def clear(self):
+        self._keypoints.clear()
+        self._window.clear()
+
+def random_walk(count, seed=0):
+    """ A walking-speed path with occasional turns, for benchmarking. """
+
+    rng = np.random.RandomState(seed)
+    heading = np.cumsum(np.where(rng.rand(count) < 0.02, rng.randn(count), 0.01 * rng.randn(count)))
+    steps = np.column_stack((np.cos(heading), np.sin(heading), 0.01 * rng.randn(count))) * 0.5
+    return np.cumsum(steps, axis=0)
+
+if __name__ == "__main__":
+    import time
+    for count in (10000, 20000, 50000, 100000):
+        path = random_walk(count)
+        start = time.time()
+        keypoints = simplify(path, 0.7)
+        print("%6i crumbs -> %5i keypoints in %.3f s"
+              % (count, len(keypoints), time.time() - start))
+        online = OnlineSimplifier(0.7)
+        start = time.time()
+        for point in path:
+            online.add(point)
+        keypoints = online.keypoints()
+        print("%6i crumbs -> %5i keypoints online, %.1f us per crumb"
+              % (count, len(keypoints), 1e6 * (time.time() - start) / count))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+import json
+import os
+import re
+import tempfile
+import numpy as np
+from dynamodb_stream import iter_runs, path_date, run_order
+
+#   Path runs kept on disk so they can be analyzed without the DynamoDB API.
+#   Each run is one .npz of its decoded arrays, and index.json lists every
+#   run with its user id, date and phone, so finding runs never opens them.
+
+STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "PathRuns")
+
+#   Bump this when the layout of the run files changes.
+STORE_VERSION = 1
+
+PHONES = {"09F2D016-33E8-4FCC-838A-220B8B151328": "Occam Lab iPhone",
+          "899ABF35-B36B-4ACF-9D2F-23CF3A3E549B": "Chris's iPhone"}
+
+#   The arrays of a decoded run, as decode_items returns them.
+ARRAYS = ('navigation', 'navigation_times', 'path', 'keypoints', 'speech_text', 'speech_times')
+
+def phone_name(user_id):
+    """ Name of the phone a user id belongs to. """
+
+    if user_id in PHONES:
+        return PHONES[user_id]
+    return "Unknown Device " + user_id[0:4]
+
+def _numbers(values):
+    """ Float array of a DynamoDB list of {"N": "..."} numbers, or the list
+    itself if dynamodb_stream already made it an array. """
+
+    if isinstance(values, np.ndarray):
+        return values
+    return np.array([value[u'N'] for value in values], dtype=float)
+
+def _list(item, key):
+    return item.get(key, {}).get(u'L', [])
+
+def _column(items, key):
+    """ Float array of the numbers under key in every item. """
+
+    parts = [_numbers(_list(item, key)) for item in items]
+    return np.concatenate(parts) if parts else np.zeros(0)
+
+def _rows(items, key, width):
+    """ (N, width) array of the lists of numbers under key in every item,
+    e.g. the 16 values of each pose matrix. """
+
+    parts = []
+    for item in items:
+        rows = _list(item, key)
+        if isinstance(rows, np.ndarray):
+            parts.append(rows)
+        elif rows:
+            values = [_numbers(row[u'L']) for row in rows]
+            parts.append(np.concatenate(values).reshape(len(rows), -1))
+    parts = [part[:, 0:width] for part in parts]
+    return np.vstack(parts) if parts else np.zeros((0, width))
+
+def decode_items(items):
+    """ The DynamoDB items of one run as a dict of numpy arrays: navigation
+    and path pose matrices as rows of 16, navigation times, keypoints (N, 3),
+    speech text and speech times. """
+
+    return {'navigation': _rows(items, u'navigationData', 16),
+            'navigation_times': _column(items, u'navigationDataTime'),
+            'path': _rows(items, u'PathData', 16),
+            'keypoints': _rows(items, u'keypointData', 3),
+            'speech_text': np.array([text[u'S'] for item in items
+                                     for text in _list(item, u'speechData')], dtype='U'),
+            'speech_times': _column(items, u'speechDataTime')}
+
+def run_id(item):
+    """ PathID of the run an item belongs to.  Long runs are split over
+    several items whose PathIDs differ only in the last two characters. """
+
+    return item[u'PathID'][u'S'][:-2]
+
+def run_header(items, user_id=None):
+    """ path_id, user_id, date and phone of the items of one run.  The
+    PathID starts with the 36 character id of the phone. """
+
+    path_id = items[0][u'PathID'][u'S']
+    date = path_date(items[0])
+    if user_id is None:
+        user_id = items[0].get(u'userId', {}).get(u'S', path_id[0:36])
+    return {'path_id': path_id, 'user_id': user_id, 'date': date, 'phone': phone_name(user_id)}
+
+def group_runs(items):
+    """ Lists of the items of each run, in the order the runs first appear. """
+
+    runs = {}
+    order = []
+    for item in items:
+        key = run_id(item)
+        if key not in runs:
+            runs[key] = []
+            order.append(key)
+        runs[key].append(item)
+    return [runs[key] for key in order]
+
+class PathStore(object):
+    """ A directory of decoded path runs and the index of them. """
+
+    def __init__(self, root=STORE):
+        self.root = root
+        self.index_path = os.path.join(root, "index.json")
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as index_file:
+                index = json.load(index_file)
+            if index.get('version') == STORE_VERSION:
+                self.index = index['runs']
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, path_id):
+        return path_id in self.index
+
+    def _write(self, name, write):
+        """ Writes the file name through write(file) to a temporary file and
+        renames it into place, so readers never see a partial file. """
+
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        handle, tmp_path = tempfile.mkstemp(prefix="." + name, dir=self.root)
+        try:
+            with os.fdopen(handle, 'wb') as tmp_file:
+                write(tmp_file)
+            os.rename(tmp_path, os.path.join(self.root, name))
+        except:
+            os.remove(tmp_path)
+            raise
+
+    def save_index(self):
+        text = json.dumps({'version': STORE_VERSION, 'runs': self.index}, indent=1, sort_keys=True)
+        self._write("index.json", lambda index_file: index_file.write(text.encode('utf-8')))
+
+    def add_run(self, items, user_id=None, save=True):
+        """ Stores the items of one run, replacing any earlier copy, and
+        returns its index entry. """
+
+        entry = run_header(items, user_id)
+        arrays = decode_items(items)
+        entry['file'] = re.sub(r'[^A-Za-z0-9_.-]', '_', entry['path_id']) + ".npz"
+        entry['poses'] = len(arrays['navigation'])
+        entry['instructions'] = len(arrays['speech_times'])
+        self._write(entry['file'], lambda run_file: np.savez_compressed(run_file, **arrays))
+        self.index[entry.pop('path_id')] = entry
+        if save:
+            self.save_index()
+        return entry
+
+    def import_dump(self, dump, user_id=None):
+        """ Stores every run of a DynamoDB response, either parsed or the path
+        of a JSON file of one, and returns their path ids.  A file is streamed
+        a run at a time. """
+
+        path_ids = []
+        if isinstance(dump, dict):
+            runs = group_runs(dump.get(u'Items', []))
+        else:
+            dump_file = open(dump, 'rb')
+            runs = iter_runs(dump_file)
+        try:
+            for items in runs:
+                self.add_run(items, user_id, save=False)
+                path_ids.append(items[0][u'PathID'][u'S'])
+        finally:
+            if not isinstance(dump, dict):
+                dump_file.close()
+        self.save_index()
+        return path_ids
+
+    def runs(self, user_id=None, date=None, phone=None):
+        """ (path_id, entry) of the stored runs, oldest first by run_order,
+        keeping those of user_id and phone and whose date starts with date if
+        given. """
+
+        found = []
+        for path_id, entry in self.index.items():
+            if ((user_id is None or entry['user_id'] == user_id)
+                    and (date is None or entry['date'].startswith(date))
+                    and (phone is None or entry['phone'] == phone)):
+                found.append((path_id, entry))
+        return sorted(found, key=lambda run: run_order(run[0], run[1]['date']))
+
+    def load(self, path_id):
+        """ The arrays of a stored run as a dict.  Raises KeyError for a run
+        that isn't in the store. """
+
+        entry = self.index[path_id]
+        with np.load(os.path.join(self.root, entry['file'])) as run_file:
+            return dict((name, run_file[name]) for name in ARRAYS)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Stores exported path runs for offline analysis.")
+    parser.add_argument("dump", nargs="*", help="DynamoDB JSON exports to import")
+    parser.add_argument("--store", default=STORE, help="store directory (default: %(default)s)")
+    parser.add_argument("--user", help="user id of the imported runs, or only list this user's runs")
+    parser.add_argument("--date", help="only list runs whose date starts with this")
+    args = parser.parse_args()
+    store = PathStore(args.store)
+    for dump in args.dump:
+        print("%s: %i runs" % (dump, len(store.import_dump(dump, args.user))))
+    for path_id, entry in store.runs(args.user, args.date):
+        print("%-20s %-24s %6i poses %4i instructions  %s"
+              % (entry['date'], entry['phone'], entry['poses'], entry['instructions'], path_id))
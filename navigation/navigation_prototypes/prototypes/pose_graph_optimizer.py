@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+
+import sys
+import threading
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+import se3
+from g2o_graph import G2OGraph, isin, load_g2o, write_g2o
+
+#   Sparse Levenberg-Marquardt over SE(3) with the same error model as g2o's
+#   EDGE_SE3:QUAT, so information matrices recorded for g2o mean the same
+#   thing here.  The error of an edge i -> j with measurement Z is
+#   Z^-1 * Xi^-1 * Xj written as translation plus the vector part of its
+#   quaternion (taken with w >= 0).  Vertices are updated on the right,
+#   X * [dt, dq], with the same 6 value increment.
+
+_UPPER = np.triu_indices(6)
+_STEP = 1e-6        # Central difference step for the edge Jacobians.
+_CONVERGED = 1e-10  # Steps smaller than this end the optimization.
+_STEPS = np.vstack((np.eye(6), -np.eye(6))) * _STEP
+
+def information_matrices(information):
+    """ (M, 6, 6) symmetric matrices from (M, 21) g2o upper triangles. """
+
+    information = np.asarray(information, dtype=float)
+    full = np.zeros((len(information), 6, 6))
+    full[:, _UPPER[0], _UPPER[1]] = information
+    full[:, _UPPER[1], _UPPER[0]] = information
+    return full
+
+def increment(poses, delta):
+    """ Applies (..., 6) increments dx dy dz dqx dqy dqz to (..., 7) poses. """
+
+    delta = np.asarray(delta, dtype=float)
+    dq = delta[..., 3:6]
+    dw = np.sqrt(np.maximum(1 - np.sum(dq * dq, axis=-1, keepdims=True), 0))
+    return se3.compose(poses, np.concatenate((delta[..., 0:3], dq, dw), axis=-1))
+
+def _error_vector(error):
+    """ translation + quaternion vector part (with w >= 0) of (..., 7) poses. """
+
+    sign = np.where(error[..., 6:7] < 0, -1.0, 1.0)
+    return np.concatenate((error[..., 0:3], error[..., 3:6] * sign), axis=-1)
+
+def edge_errors(poses_i, poses_j, measurements):
+    """ (M, 6) g2o errors of edges with the given end poses. """
+
+    return _error_vector(se3.relative(measurements, se3.relative(poses_i, poses_j)))
+
+def linearize(poses_i, poses_j, measurements):
+    """ Errors and (M, 6, 6) Jacobians of the errors with respect to the
+    increments of both end poses, for all edges at once.
+
+    With B = Xi^-1 * Xj, incrementing Xi by D gives Z^-1 * D^-1 * B and
+    incrementing Xj gives Z^-1 * B * D, so each central difference only
+    composes the precomputed per edge poses with one small constant pose. """
+
+    inverse = se3.invert(measurements)
+    between = se3.relative(poses_i, poses_j)
+    error_poses = se3.compose(inverse, between)
+    #   All 12 perturbations (+/- each increment) broadcast as a (12, 1, 7)
+    #   stack against the (M, 7) edges.
+    steps = increment(np.array([0, 0, 0, 0, 0, 0, 1.0]), _STEPS)[:, np.newaxis, :]
+    perturbed_i = _error_vector(se3.compose(inverse, se3.compose(se3.invert(steps), between)))
+    perturbed_j = _error_vector(se3.compose(error_poses, steps))
+    jacobian_i = (perturbed_i[:6] - perturbed_i[6:]).transpose(1, 2, 0) / (2 * _STEP)
+    jacobian_j = (perturbed_j[:6] - perturbed_j[6:]).transpose(1, 2, 0) / (2 * _STEP)
+    return _error_vector(error_poses), jacobian_i, jacobian_j
+
+def chi2(errors, information):
+    """ Sum of e^T * Omega * e over all edges. """
+
+    return float(np.einsum('mi,mij,mj->', errors, information, errors))
+
+class PoseGraphOptimizer(object):
+    """ Optimizes the vertices of a G2OGraph in memory.  Vertices listed in
+    the graph's FIX records are held in place; if there are none, the first
+    vertex is, to pin down the gauge the way g2o does.  Like g2o, edges to
+    vertices that are not in the graph are skipped. """
+
+    def __init__(self, graph, verbose=False):
+        self.graph = graph
+        self.verbose = verbose
+        self.poses = graph.poses
+        known = (isin(graph.edge_ids[:, 0], graph.vertex_ids)
+                 & isin(graph.edge_ids[:, 1], graph.vertex_ids))
+        if verbose and not known.all():
+            print("skipping %i edges to missing vertices" % np.sum(~known))
+        edge_ids = graph.edge_ids[known]
+        self.edge_rows = np.column_stack((graph.index_of(edge_ids[:, 0]),
+                                          graph.index_of(edge_ids[:, 1])))
+        self.measurements = graph.measurements[known]
+        self.information = information_matrices(graph.information[known])
+        fixed = np.zeros(len(self.poses), dtype=bool)
+        if len(graph.fixed_ids):
+            fixed[graph.index_of(graph.fixed_ids)] = True
+        elif len(fixed):
+            fixed[0] = True
+        self.fixed = fixed
+        self.chi2_history = []
+
+    def chi2(self):
+        errors = edge_errors(self.poses[self.edge_rows[:, 0]],
+                             self.poses[self.edge_rows[:, 1]],
+                             self.measurements)
+        return chi2(errors, self.information)
+
+    def optimize(self, iterations=20, tolerance=1e-6):
+        """ Runs up to iterations Levenberg-Marquardt steps, stopping early when
+        chi2 improves by less than the relative tolerance.  Returns the
+        optimized (N, 3) translations and (N, 4) quaternions. """
+
+        self.poses = optimize_poses(self.poses, self.edge_rows, self.measurements,
+                                    self.information, ~self.fixed, iterations,
+                                    tolerance, self.chi2_history, self.verbose)
+        return self.poses[:, 0:3], self.poses[:, 3:7]
+
+    def result(self):
+        """ Copy of the graph with the current vertex estimates. """
+
+        return G2OGraph(self.graph.vertex_ids, self.poses[:, 0:3].copy(),
+                        self.poses[:, 3:7].copy(), self.graph.edge_ids,
+                        self.graph.measurements, self.graph.information,
+                        self.graph.fixed_ids)
+
+def optimize_poses(poses, edge_rows, measurements, information, free,
+                   iterations=20, tolerance=1e-6, history=None, verbose=False):
+    """ Levenberg-Marquardt on (N, 7) poses.  edge_rows holds the (M, 2) pose
+    rows each edge connects, information the (M, 6, 6) matrices and free a
+    boolean mask of the poses that may move.  Returns the new poses. """
+
+    poses = np.array(poses, dtype=float)
+    free_rows = np.flatnonzero(free)
+    column = -np.ones(len(poses), dtype=np.int64)
+    column[free_rows] = np.arange(len(free_rows))
+    block_i = column[edge_rows[:, 0]]
+    block_j = column[edge_rows[:, 1]]
+    size = 6 * len(free_rows)
+    if history is None:
+        history = []
+    if not size or not len(edge_rows):
+        return poses
+
+    errors, jacobian_i, jacobian_j = linearize(poses[edge_rows[:, 0]],
+                                               poses[edge_rows[:, 1]],
+                                               measurements)
+    current = chi2(errors, information)
+    history.append(current)
+    damping = None
+    for iteration in range(iterations):
+        hessian, gradient = _normal_equations(errors, jacobian_i, jacobian_j,
+                                              information, block_i, block_j, size)
+        if damping is None:
+            damping = 1e-5 * max(hessian.diagonal().max(), 1e-9)
+        accepted = False
+        while not accepted and damping < 1e10:
+            step = spsolve((hessian + damping * sparse.identity(size)).tocsc(),
+                           -gradient)
+            if not np.abs(step).max() > _CONVERGED:
+                break
+            candidate = poses.copy()
+            candidate[free_rows] = increment(poses[free_rows], step.reshape(-1, 6))
+            candidate_errors = edge_errors(candidate[edge_rows[:, 0]],
+                                           candidate[edge_rows[:, 1]],
+                                           measurements)
+            candidate_chi2 = chi2(candidate_errors, information)
+            if np.isfinite(candidate_chi2) and candidate_chi2 <= current:
+                accepted = True
+                damping = max(damping / 3, 1e-12)
+            else:
+                damping *= 10
+        if not accepted:
+            break
+        improvement = current - candidate_chi2
+        poses = candidate
+        current = candidate_chi2
+        history.append(current)
+        if verbose:
+            print("iteration %i chi2 %f lambda %g" % (iteration, current, damping))
+        if improvement <= tolerance * max(current, 1e-12):
+            break
+        errors, jacobian_i, jacobian_j = linearize(poses[edge_rows[:, 0]],
+                                                   poses[edge_rows[:, 1]],
+                                                   measurements)
+    return poses
+
+def _normal_equations(errors, jacobian_i, jacobian_j, information,
+                      block_i, block_j, size):
+    """ Sparse J^T * Omega * J and J^T * Omega * e over the free poses. """
+
+    weighted_i = np.matmul(jacobian_i.transpose(0, 2, 1), information)
+    weighted_j = np.matmul(jacobian_j.transpose(0, 2, 1), information)
+    blocks = ((block_i, block_i, np.matmul(weighted_i, jacobian_i)),
+              (block_i, block_j, np.matmul(weighted_i, jacobian_j)),
+              (block_j, block_i, np.matmul(weighted_j, jacobian_i)),
+              (block_j, block_j, np.matmul(weighted_j, jacobian_j)))
+    offsets = np.arange(6)
+    rows, cols, values = [], [], []
+    for row_block, col_block, value in blocks:
+        used = (row_block >= 0) & (col_block >= 0)
+        r = 6 * row_block[used][:, np.newaxis, np.newaxis] + offsets[:, np.newaxis]
+        c = 6 * col_block[used][:, np.newaxis, np.newaxis] + offsets[np.newaxis, :]
+        rows.append(np.broadcast_to(r, value[used].shape).ravel())
+        cols.append(np.broadcast_to(c, value[used].shape).ravel())
+        values.append(value[used].ravel())
+    hessian = sparse.coo_matrix((np.concatenate(values),
+                                 (np.concatenate(rows), np.concatenate(cols))),
+                                shape=(size, size)).tocsr()
+
+    gradient = np.zeros(size)
+    for block, weighted in ((block_i, weighted_i), (block_j, weighted_j)):
+        used = block >= 0
+        g = np.matmul(weighted[used], errors[used][:, :, np.newaxis])[:, :, 0]
+        index = 6 * block[used][:, np.newaxis] + offsets
+        np.add.at(gradient, index.ravel(), g.ravel())
+    return hessian, gradient
+
+class IncrementalOptimizer(object):
+    """ Sliding window optimization of a graph that is still being recorded.
+    Records are added with the same calls as G2OWriter.  update() then
+    relinearizes and re-solves only the newest window vertices, holding every
+    older vertex at its current estimate, so an update costs about the same
+    however long the recording has run.  Edges to vertices that were never
+    added are skipped. """
+
+    def __init__(self, window=60, iterations=3):
+        self.window = window            # Number of newest vertices re-solved per update.
+        self.iterations = iterations    # Levenberg-Marquardt steps per update.
+        self._lock = threading.Lock()
+        self._rows = {}                 # vertex id -> row
+        self._vertex_count = 0
+        self._edge_count = 0
+        self._poses = np.zeros((64, 7))         # Current estimates.
+        self._raw = np.zeros((64, 7))           # Poses as recorded.
+        self._fixed = np.zeros(64, dtype=bool)
+        self._first_edge = np.zeros(64, dtype=np.int64)    # Edge count when each vertex was added.
+        self._edge_rows = np.zeros((64, 2), dtype=np.int64)
+        self._measurements = np.zeros((64, 7))
+        self._information = np.zeros((64, 6, 6))
+
+    def add_vertex(self, vertex_id, trans, rot):
+        with self._lock:
+            if vertex_id in self._rows:
+                return
+            row = self._vertex_count
+            if row == len(self._poses):
+                self._poses, self._raw, self._fixed, self._first_edge = \
+                    _grow(self._poses, self._raw, self._fixed, self._first_edge)
+            self._poses[row, 0:3] = trans
+            self._poses[row, 3:7] = rot
+            self._raw[row] = self._poses[row]
+            self._fixed[row] = False
+            self._first_edge[row] = self._edge_count
+            self._rows[vertex_id] = row
+            self._vertex_count += 1
+
+    def add_edge(self, from_id, to_id, trans, rot, information):
+        with self._lock:
+            if from_id not in self._rows or to_id not in self._rows:
+                return
+            row = self._edge_count
+            if row == len(self._edge_rows):
+                self._edge_rows, self._measurements, self._information = \
+                    _grow(self._edge_rows, self._measurements, self._information)
+            self._edge_rows[row] = (self._rows[from_id], self._rows[to_id])
+            self._measurements[row, 0:3] = trans
+            self._measurements[row, 3:7] = rot
+            self._information[row] = information_matrices([information])[0]
+            self._edge_count += 1
+
+    def add_fix(self, vertex_id):
+        with self._lock:
+            if vertex_id in self._rows:
+                self._fixed[self._rows[vertex_id]] = True
+
+    def update(self):
+        """ Re-solves the window of newest vertices against everything they
+        are connected to. """
+
+        with self._lock:
+            count = self._vertex_count
+            if not count:
+                return
+            start = max(count - self.window, 0)
+            #   Edges touching the window were all added after its first vertex.
+            first_edge = self._first_edge[start]
+            edge_rows = self._edge_rows[first_edge:self._edge_count]
+            rows = np.unique(np.concatenate((np.arange(start, count), edge_rows.ravel())))
+            free = (rows >= start) & ~self._fixed[rows]
+            if not self._fixed[:count].any():
+                free[rows == 0] = False
+            self._poses[rows] = optimize_poses(self._poses[rows],
+                                               np.searchsorted(rows, edge_rows),
+                                               self._measurements[first_edge:self._edge_count],
+                                               self._information[first_edge:self._edge_count],
+                                               free, self.iterations)
+
+    def __contains__(self, vertex_id):
+        with self._lock:
+            return vertex_id in self._rows
+
+    def pose(self, vertex_id):
+        """ Current estimate of a vertex as x y z qx qy qz qw. """
+
+        with self._lock:
+            return self._poses[self._rows[vertex_id]].copy()
+
+    def correction(self, vertex_id):
+        """ Transform taking the recorded pose of vertex_id to its current
+        estimate.  Composed onto a newer raw odometry pose it gives that pose
+        with the drift corrected so far. """
+
+        with self._lock:
+            row = self._rows[vertex_id]
+            return se3.compose(self._poses[row], se3.invert(self._raw[row]))
+
+def _grow(*arrays):
+    """ Copies of arrays with twice as many rows. """
+
+    grown = []
+    for array in arrays:
+        bigger = np.zeros((2 * len(array),) + array.shape[1:], dtype=array.dtype)
+        bigger[:len(array)] = array
+        grown.append(bigger)
+    return grown
+
+def optimize_graph(graph, iterations=20, verbose=False):
+    """ Returns a copy of graph with optimized vertices, what running the g2o
+    binary on it would produce. """
+
+    optimizer = PoseGraphOptimizer(graph, verbose)
+    optimizer.optimize(iterations)
+    return optimizer.result()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: pose_graph_optimizer.py data.g2o result.g2o")
+    else:
+        write_g2o(sys.argv[2], optimize_graph(load_g2o(sys.argv[1]), verbose=True))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import numpy as np
+import se3
+
+class PoseHistory(object):
+    """ Fixed size history of stamped poses for "where was the device at time
+    t" queries.  Samples are rows of stamp x y z qx qy qz qw in one numpy
+    array, appended in time order; once capacity is reached the oldest are
+    dropped.  The live samples are always a contiguous slice of a buffer
+    twice the capacity (it is compacted to the front when the end is
+    reached), so lookups are a searchsorted over a plain view. """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._data = np.zeros((2 * capacity, 8))
+        self._start = 0
+        self._end = 0
+
+    @classmethod
+    def from_arrays(cls, stamps, poses):
+        """ History holding exactly the given (N,) stamps and (N, 7) poses. """
+
+        history = cls(max(len(stamps), 1))
+        history.extend(stamps, poses)
+        return history
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def stamps(self):
+        return self._data[self._start:self._end, 0]
+
+    @property
+    def poses(self):
+        return self._data[self._start:self._end, 1:8]
+
+    def latest(self):
+        """ (stamp, pose) of the newest sample. """
+
+        if not len(self):
+            raise ValueError("pose history is empty")
+        row = self._data[self._end - 1]
+        return row[0], row[1:8].copy()
+
+    def append(self, stamp, pose):
+        self.extend([stamp], np.asarray(pose, dtype=float)[np.newaxis])
+
+    def extend(self, stamps, poses):
+        """ Appends (N,) stamps and (N, 7) poses.  Raises ValueError if they
+        would put the history out of time order. """
+
+        stamps = np.asarray(stamps, dtype=float)
+        poses = np.asarray(poses, dtype=float)
+        if not len(stamps):
+            return
+        if np.any(np.diff(stamps) < 0) or (len(self) and stamps[0] < self._data[self._end - 1, 0]):
+            raise ValueError("pose history stamps must not go back in time")
+        if len(stamps) > self.capacity:
+            stamps, poses = stamps[-self.capacity:], poses[-self.capacity:]
+        if self._end + len(stamps) > len(self._data):
+            keep = min(len(self), self.capacity - len(stamps))
+            self._data[0:keep] = self._data[self._end - keep:self._end]
+            self._start, self._end = 0, keep
+        self._data[self._end:self._end + len(stamps), 0] = stamps
+        self._data[self._end:self._end + len(stamps), 1:8] = poses
+        self._end += len(stamps)
+        self._start = max(self._start, self._end - self.capacity)
+
+    def nearest(self, stamps):
+        """ Index into stamps/poses of the sample closest in time to each of
+        stamps. """
+
+        times = self.stamps
+        if not len(times):
+            raise ValueError("pose history is empty")
+        stamps = np.asarray(stamps, dtype=float)
+        upper = np.clip(np.searchsorted(times, stamps), 1, max(len(times) - 1, 1))
+        lower = upper - 1
+        if len(times) == 1:
+            return np.zeros(stamps.shape, dtype=np.int64)
+        return np.where(np.abs(times[upper] - stamps) < np.abs(stamps - times[lower]), upper, lower)
+
+    def interpolate(self, stamps):
+        """ (..., 7) poses at the given stamps, interpolating linearly in
+        translation and by slerp in rotation between the samples around each
+        stamp.  Raises ValueError for stamps outside the history, as tf
+        refuses to extrapolate. """
+
+        times = self.stamps
+        stamps = np.asarray(stamps, dtype=float)
+        if not len(times) or np.any(stamps < times[0]) or np.any(stamps > times[-1]):
+            raise ValueError("stamp outside pose history [%s, %s]"
+                             % (times[0] if len(times) else None, times[-1] if len(times) else None))
+        poses = self.poses
+        upper = np.clip(np.searchsorted(times, stamps), 0, len(times) - 1)
+        lower = np.maximum(upper - 1, 0)
+        span = times[upper] - times[lower]
+        fraction = np.where(span > 0, (stamps - times[lower]) / np.where(span > 0, span, 1), 1.0)
+        translation = poses[lower, 0:3] + fraction[..., np.newaxis] * (poses[upper, 0:3] - poses[lower, 0:3])
+        rotation = se3.slerp(poses[lower, 3:7], poses[upper, 3:7], fraction)
+        return np.concatenate((translation, rotation), axis=-1)
+
+    def relative(self, stamp_from, stamp_to):
+        """ Motion of the device from stamp_from to stamp_to, in the device's
+        frame at stamp_from; what lookupTransformFull(device, stamp_from,
+        device, stamp_to, fixed) returns. """
+
+        return se3.relative(self.interpolate(stamp_from), self.interpolate(stamp_to))
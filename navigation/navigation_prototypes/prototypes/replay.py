@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+
+import json
+import math
+import sys
+import time
+import types
+import numpy as np
+import se3
+from g2o_graph import FIRST_POSE_ID, isin, load_g2o, load_naive
+
+#   Replays recorded sessions into the node classes without ROS.  Stand-ins
+#   for rospy, tf.transformations, pyttsx and the message packages are put
+#   in sys.modules before the node is imported; their clock is simulated and
+#   only moves when the node sleeps, so a recording plays back as fast as
+#   the node can take it.  Events due while the node sleeps are delivered to
+#   its subscribers in order, and the time each callback takes is recorded.
+
+POSE_TOPIC = '/tango_pose'
+KEY_TOPIC = '/keyboard/keydown'
+
+#   Recordings are lists of (stamp, kind, values) events, sorted by stamp:
+#   ('pose', [x, y, z, qx, qy, qz, qw]) or ('key', [code]).
+
+def read_log(path):
+    """ Reads a replay log: one event per line, as "<seconds> pose x y z qx qy
+    qz qw" or "<seconds> key <code>", with # starting a comment. """
+
+    events = []
+    with open(path, 'r') as log_file:
+        for line in log_file:
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            stamp, kind = float(fields[0]), fields[1]
+            if kind == 'pose':
+                events.append((stamp, kind, [float(value) for value in fields[2:9]]))
+            elif kind == 'key':
+                events.append((stamp, kind, [int(fields[2])]))
+            else:
+                raise ValueError("%s: unknown event %r" % (path, kind))
+    events.sort(key=lambda event: event[0])
+    return events
+
+def write_log(path, events):
+    with open(path, 'w') as log_file:
+        for stamp, kind, values in events:
+            log_file.write("%.6f %s %s\n" % (stamp, kind, " ".join(repr(value) for value in values)))
+
+def read_poses(path):
+    """ The (N, 7) phone poses of a recording: pose vertices of a .g2o file,
+    PATH records of a naive .txt file, or the [x, y, z, yaw] vio_crumbs of a
+    .json file from data/. """
+
+    if path.endswith('.g2o'):
+        graph = load_g2o(path)
+        #   Orientation dummies are the fixed vertices among the poses
+        keep = (graph.vertex_ids >= FIRST_POSE_ID) & ~isin(graph.vertex_ids, graph.fixed_ids)
+        order = np.argsort(graph.vertex_ids[keep], kind="mergesort")
+        return graph.poses[keep][order]
+    if path.endswith('.json'):
+        with open(path, 'r') as json_file:
+            crumbs = np.array(json.load(json_file)['vio_crumbs'], dtype=float).reshape(-1, 4)
+        return np.hstack((crumbs[:, 0:3], se3.quaternion_from_euler(0, 0, crumbs[:, 3])))
+    return load_naive(path)[1]
+
+def pose_events(poses, rate, start=0.0):
+    """ Poses as events, rate per second.  None of the recordings but the
+    replay log keep times, so poses are spread out evenly. """
+
+    return [(start + i / float(rate), 'pose', list(pose))
+            for i, pose in enumerate(np.asarray(poses).tolist())]
+
+def breadcrumb_session(poses, rate=5.0, pause=2.0):
+    """ A Breadcrumbs session over a recorded walk: the route is recorded on
+    the way out, then followed back to the start. """
+
+    out = pose_events(poses, rate, 1.0)
+    back = pose_events(poses[::-1], rate, out[-1][0] + 2 * pause)
+    keys = [(0.5, 'key', [ord('d')]),
+            (out[-1][0] + pause / 2, 'key', [ord('s')]),
+            (out[-1][0] + pause, 'key', [ord('c')])]
+    return sorted(out + keys + back, key=lambda event: event[0])
+
+def summary(values):
+    """ count, mean, p95 and max of a list of seconds, in milliseconds. """
+
+    values = np.array(values, dtype=float) * 1e3
+    if not len(values):
+        return {'count': 0}
+    return {'count': len(values), 'mean_ms': float(values.mean()),
+            'p95_ms': float(np.percentile(values, 95)), 'max_ms': float(values.max())}
+
+class Replay(object):
+    """ Simulated ROS for one node: the clock, topics and stand-in modules. """
+
+    def __init__(self, events, tail=5.0):
+        self.events = events
+        self.tail = tail
+        self.now = events[0][0] if events else 0.0
+        self.end = (events[-1][0] if events else 0.0) + tail
+        self.subscribers = {}       # topic -> [callback]
+        self.published = {}         # topic -> message count
+        self.latencies = {}         # topic -> [seconds per callback]
+        self.spoken = []            # (stamp, text)
+        self._next = 0
+        self.modules = standin_modules(self)
+
+    def install(self):
+        sys.modules.update(self.modules)
+
+    @property
+    def finished(self):
+        return self._next >= len(self.events) and self.now >= self.end
+
+    def advance(self, seconds):
+        """ Moves the clock on, delivering the events due on the way. """
+
+        target = self.now + seconds
+        while self._next < len(self.events) and self.events[self._next][0] <= target:
+            stamp, kind, values = self.events[self._next]
+            self._next += 1
+            self.now = max(self.now, stamp)
+            if kind == 'pose':
+                self.deliver(POSE_TOPIC, self.pose_message(values))
+            else:
+                self.deliver(KEY_TOPIC, self.modules['keyboard.msg'].Key(code=values[0]))
+        self.now = max(self.now, target)
+
+    def deliver(self, topic, message):
+        for callback in self.subscribers.get(topic, ()):
+            start = time.time()
+            callback(message)
+            self.latencies.setdefault(topic, []).append(time.time() - start)
+
+    def pose_message(self, values):
+        msg = self.modules['geometry_msgs.msg']
+        rospy = self.modules['rospy']
+        return msg.PoseStamped(
+            header=self.modules['std_msgs.msg'].Header(stamp=rospy.Time.from_sec(self.now), frame_id='odom'),
+            pose=msg.Pose(position=msg.Point(*values[0:3]), orientation=msg.Quaternion(*values[3:7])))
+
+    def report(self, wall_time):
+        simulated = self.end - (self.events[0][0] if self.events else 0.0)
+        return {'events': len(self.events),
+                'simulated_s': simulated,
+                'wall_s': wall_time,
+                'speedup': simulated / wall_time if wall_time else None,
+                'events_per_s': len(self.events) / wall_time if wall_time else None,
+                'callbacks': dict((topic, summary(values)) for topic, values in self.latencies.items()),
+                'published': dict(self.published),
+                'spoken': len(self.spoken)}
+
+def standin_modules(replay):
+    """ Modules standing in for what the nodes import from ROS, bound to
+    replay's clock and topics. """
+
+    class Duration(object):
+        def __init__(self, secs=0, nsecs=0):
+            self.sec = secs + nsecs * 1e-9
+
+        @classmethod
+        def from_sec(cls, sec):
+            return cls(sec)
+
+        def to_sec(self):
+            return self.sec
+
+        def __add__(self, other):
+            return Duration(self.sec + other.sec)
+
+        def __sub__(self, other):
+            return Duration(self.sec - other.sec)
+
+        def __neg__(self):
+            return Duration(-self.sec)
+
+        def __eq__(self, other):
+            return isinstance(other, Duration) and self.sec == other.sec
+
+        def __ne__(self, other):
+            return not self == other
+
+        def __lt__(self, other):
+            return self.sec < other.sec
+
+        def __le__(self, other):
+            return self.sec <= other.sec
+
+        def __gt__(self, other):
+            return self.sec > other.sec
+
+        def __ge__(self, other):
+            return self.sec >= other.sec
+
+        def __hash__(self):
+            return hash(self.sec)
+
+        def __repr__(self):
+            return "Duration(%r)" % self.sec
+
+    class Time(Duration):
+        @classmethod
+        def now(cls):
+            return cls(replay.now)
+
+        def __add__(self, other):
+            return Time(self.sec + other.sec)
+
+        def __sub__(self, other):
+            if isinstance(other, Time):
+                return Duration(self.sec - other.sec)
+            return Time(self.sec - other.sec)
+
+        def __eq__(self, other):
+            return isinstance(other, Time) and self.sec == other.sec
+
+        def is_zero(self):
+            return self.sec == 0
+
+        def __repr__(self):
+            return "Time(%r)" % self.sec
+
+    class Rate(object):
+        def __init__(self, hz):
+            self.period = 1.0 / hz
+
+        def sleep(self):
+            replay.advance(self.period)
+
+    class Subscriber(object):
+        def __init__(self, topic, data_class, callback, queue_size=None):
+            replay.subscribers.setdefault(topic, []).append(callback)
+
+    class Publisher(object):
+        def __init__(self, topic, data_class, queue_size=None, latch=False):
+            self.topic = topic
+
+        def publish(self, *args, **kwargs):
+            replay.published[self.topic] = replay.published.get(self.topic, 0) + 1
+
+        def get_num_connections(self):
+            return 0
+
+    rospy = types.ModuleType('rospy')
+    rospy.Time, rospy.Duration, rospy.Rate = Time, Duration, Rate
+    rospy.Subscriber, rospy.Publisher = Subscriber, Publisher
+    rospy.init_node = lambda name, **kwargs: None
+    rospy.is_shutdown = lambda: replay.finished
+    rospy.sleep = lambda duration: replay.advance(getattr(duration, 'sec', duration))
+    rospy.get_param = lambda name, default=None: default
+    rospy.on_shutdown = lambda hook: None
+    rospy.loginfo = rospy.logwarn = rospy.logerr = lambda text, *args: None
+
+    class Message(object):
+        """ Fields and their default factories are listed in _fields. """
+
+        __slots__ = ()
+        _fields = ()
+
+        def __init__(self, *args, **kwargs):
+            for (name, default), value in zip(self._fields, args):
+                kwargs[name] = value
+            for name, default in self._fields:
+                setattr(self, name, kwargs[name] if name in kwargs else default())
+
+        def __eq__(self, other):
+            return type(other) is type(self) and \
+                all(getattr(self, name) == getattr(other, name) for name, _ in self._fields)
+
+        def __ne__(self, other):
+            return not self == other
+
+    def message(name, *fields, **constants):
+        constants['_fields'] = fields
+        constants['__slots__'] = tuple(field for field, _ in fields)
+        return type(name, (Message,), constants)
+
+    zero = lambda: 0.0
+    Header = message('Header', ('seq', int), ('stamp', Time), ('frame_id', str))
+    Point = message('Point', ('x', zero), ('y', zero), ('z', zero))
+    Vector3 = message('Vector3', ('x', zero), ('y', zero), ('z', zero))
+    Quaternion = message('Quaternion', ('x', zero), ('y', zero), ('z', zero), ('w', zero))
+    Pose = message('Pose', ('position', Point), ('orientation', Quaternion))
+    PoseStamped = message('PoseStamped', ('header', Header), ('pose', Pose))
+    ColorRGBA = message('ColorRGBA', ('r', zero), ('g', zero), ('b', zero), ('a', zero))
+    String = message('String', ('data', str))
+    Key = message('Key', ('header', Header), ('code', int), ('modifiers', int))
+    Marker = message('Marker', ('header', Header), ('ns', str), ('id', int),
+                     ('type', int), ('action', int), ('pose', Pose),
+                     ('scale', Vector3), ('color', ColorRGBA),
+                     ('lifetime', Duration), ('frame_locked', bool),
+                     ('points', list), ('colors', list), ('text', str),
+                     ('mesh_resource', str), ('mesh_use_embedded_materials', bool),
+                     ARROW=0, CUBE=1, SPHERE=2, CYLINDER=3, LINE_STRIP=4,
+                     LINE_LIST=5, CUBE_LIST=6, SPHERE_LIST=7, POINTS=8,
+                     TEXT_VIEW_FACING=9, MESH_RESOURCE=10, TRIANGLE_LIST=11,
+                     ADD=0, MODIFY=0, DELETE=2, DELETEALL=3)
+    MarkerArray = message('MarkerArray', ('markers', list))
+
+    def euler_from_quaternion(q, axes='sxyz'):
+        x, y, z, w = q
+        return (math.atan2(2 * (w*x + y*z), 1 - 2 * (x*x + y*y)),
+                math.asin(max(-1.0, min(1.0, 2 * (w*y - z*x)))),
+                math.atan2(2 * (w*z + x*y), 1 - 2 * (y*y + z*z)))
+
+    def quaternion_from_euler(roll, pitch, yaw, axes='sxyz'):
+        return se3.quaternion_from_euler(roll, pitch, yaw)
+
+    class Engine(object):
+        def say(self, text):
+            replay.spoken.append((replay.now, text))
+
+        def runAndWait(self):
+            pass
+
+    modules = {}
+    def module(name, **attributes):
+        modules[name] = types.ModuleType(name)
+        for attribute, value in attributes.items():
+            setattr(modules[name], attribute, value)
+        if '.' in name:
+            parent, child = name.rsplit('.', 1)
+            setattr(modules[parent], child, modules[name])
+        return modules[name]
+
+    modules['rospy'] = rospy
+    module('geometry_msgs')
+    module('geometry_msgs.msg', Point=Point, Vector3=Vector3, Quaternion=Quaternion,
+           Pose=Pose, PoseStamped=PoseStamped)
+    module('std_msgs')
+    module('std_msgs.msg', Header=Header, ColorRGBA=ColorRGBA, String=String)
+    module('visualization_msgs')
+    module('visualization_msgs.msg', Marker=Marker, MarkerArray=MarkerArray)
+    module('keyboard')
+    module('keyboard.msg', Key=Key)
+    module('tf')
+    module('tf.transformations', euler_from_quaternion=euler_from_quaternion,
+           quaternion_from_euler=quaternion_from_euler,
+           quaternion_multiply=lambda q1, q2: se3.quaternion_multiply(q1, q2))
+    module('pyttsx', init=Engine)
+    return modules
+
+def replay_breadcrumbs(events, **parameters):
+    """ Runs a Breadcrumbs node over events and returns the replay report.
+    parameters override the node's attributes, e.g. crumb_radius. """
+
+    replay = Replay(events)
+    replay.install()
+    from breadcrumbs import Breadcrumbs
+    node = Breadcrumbs()
+    for name, value in parameters.items():
+        setattr(node, name, value)
+    start = time.time()
+    node.run()
+    wall_time = time.time() - start
+    node.speech.stop()
+    report = replay.report(wall_time)
+    report['crumbs'] = len(node.crumbs)
+    if node.route is not None:
+        report['keypoints'] = len(node.route)
+        report['keypoints_reached'] = node.route.cursor
+    return report
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: replay.py recording [pose rate]")
+        sys.exit(1)
+    recording = sys.argv[1]
+    if recording.endswith('.log'):
+        events = read_log(recording)
+    else:
+        rate = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+        events = breadcrumb_session(read_poses(recording), rate)
+    print(json.dumps(replay_breadcrumbs(events, path_width=0.7, crumb_radius=1,
+                                        crumb_interval=0.5), indent=2, sort_keys=True))
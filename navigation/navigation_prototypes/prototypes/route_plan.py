@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+class RoutePlan(object):
+    """ A recorded route to follow, keypoint by keypoint.  Everything about a
+    leg that doesn't depend on where the user is facing (its length, slope,
+    and the stairs and distance parts of its instruction) is worked out once
+    when the plan is made.  Following it only moves a cursor along
+    the keypoints, so each pose costs a distance check against one point.
+
+    Leg i is the one that ends at keypoint i; there is no leg 0. """
+
+    def __init__(self, keypoints, radius, stair_slope=0.3):
+        self.points = np.array(keypoints, dtype=float).reshape(-1, 3)
+        self.radius = radius
+        self.cursor = 0
+        self._targets = self.points.tolist()
+
+        legs = np.diff(self.points, axis=0)
+        self.lengths = np.concatenate(([0], np.hypot(legs[:, 0], legs[:, 1])))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.slopes = np.concatenate(([0], np.nan_to_num(legs[:, 2] / self.lengths[1:])))
+
+        self.stairs = [""] * len(self.points)
+        self.distances = [""] * len(self.points)
+        for i in range(1, len(self.points)):
+            if self.slopes[i] >= stair_slope:
+                self.stairs[i] = " and walk up the stairs"
+            elif self.slopes[i] <= -stair_slope:
+                self.stairs[i] = " and walk down the stairs"
+            self.distances[i] = " for %s meters" % round(self.lengths[i], 1)
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def target(self):
+        """ The keypoint being walked to, as an [x, y, z] list. """
+
+        return self._targets[self.cursor]
+
+    @property
+    def last(self):
+        """ Whether the target is the end of the route. """
+
+        return self.cursor >= len(self._targets) - 1
+
+    def reached(self, x, y, z):
+        """ Whether (x, y, z) is within the radius of the target. """
+
+        target = self._targets[self.cursor]
+        dx, dy, dz = x - target[0], y - target[1], z - target[2]
+        return dx * dx + dy * dy + dz * dz <= self.radius * self.radius
+
+    def advance(self):
+        """ Makes the next keypoint the target. """
+
+        if not self.last:
+            self.cursor += 1
+
+    def remaining(self):
+        """ The keypoints from the target on, as a view. """
+
+        return self.points[self.cursor:]
+
+    def instruction(self, stairs=True, distances=True):
+        """ What to add to the clock direction when announcing the leg to
+        the target. """
+
+        text = ""
+        if stairs:
+            text += self.stairs[self.cursor]
+        if distances:
+            text += self.distances[self.cursor]
+        return text + "."
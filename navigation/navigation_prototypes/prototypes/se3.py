@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+#   Batched rigid body transforms.  A pose is a length 7 row
+#   x y z qx qy qz qw, the same layout as a g2o VERTEX_SE3:QUAT / EDGE_SE3:QUAT
+#   record and as (trans + rot) from tf.  Every function takes arrays of shape
+#   (..., 7) or (..., 4) and works on all leading rows at once, so whole
+#   trajectories are handled with a few numpy calls instead of a python loop.
+
+def normalize(q):
+    """ (..., 4) quaternions scaled to unit length.  Values read back from
+    text files are rounded, so inputs are normalized before use as tf does. """
+
+    q = np.asarray(q, dtype=float)
+    return q / np.linalg.norm(q, axis=-1)[..., np.newaxis]
+
+def quaternion_multiply(q1, q2):
+    """ Hamilton product q1 * q2 of (..., 4) x y z w quaternions. """
+
+    q1 = np.asarray(q1, dtype=float)
+    q2 = np.asarray(q2, dtype=float)
+    x1, y1, z1, w1 = q1[..., 0], q1[..., 1], q1[..., 2], q1[..., 3]
+    x2, y2, z2, w2 = q2[..., 0], q2[..., 1], q2[..., 2], q2[..., 3]
+    return np.stack((w1*x2 + x1*w2 + y1*z2 - z1*y2,
+                     w1*y2 - x1*z2 + y1*w2 + z1*x2,
+                     w1*z2 + x1*y2 - y1*x2 + z1*w2,
+                     w1*w2 - x1*x2 - y1*y2 - z1*z2), axis=-1)
+
+def quaternion_conjugate(q):
+    """ Inverse rotation of (..., 4) unit quaternions. """
+
+    q = np.array(q, dtype=float)
+    q[..., 0:3] *= -1
+    return q
+
+def rotate(q, v):
+    """ Rotates (..., 3) vectors v by (..., 4) unit quaternions q. """
+
+    q = np.asarray(q, dtype=float)
+    v = np.asarray(v, dtype=float)
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    vx, vy, vz = v[..., 0], v[..., 1], v[..., 2]
+    #   v + 2w(u x v) + 2u x (u x v), with u the vector part, written out to
+    #   avoid np.cross overhead on small batches.
+    tx = 2 * (y*vz - z*vy)
+    ty = 2 * (z*vx - x*vz)
+    tz = 2 * (x*vy - y*vx)
+    return np.stack((vx + w*tx + y*tz - z*ty,
+                     vy + w*ty + z*tx - x*tz,
+                     vz + w*tz + x*ty - y*tx), axis=-1)
+
+def quaternion_matrix(q):
+    """ (..., 3, 3) rotation matrices of (..., 4) quaternions. """
+
+    q = normalize(q)
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    return np.stack((np.stack((1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)), axis=-1),
+                     np.stack((2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)), axis=-1),
+                     np.stack((2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)), axis=-1)),
+                    axis=-2)
+
+def quaternion_from_matrix(matrix):
+    """ (..., 4) unit quaternions, with w >= 0, of (..., 3, 3) rotation
+    matrices (or the rotation block of (..., 4, 4) transforms). """
+
+    m = np.asarray(matrix, dtype=float)[..., 0:3, 0:3]
+    trace = m[..., 0, 0] + m[..., 1, 1] + m[..., 2, 2]
+
+    #   Pick, per matrix, the largest of w, x, y, z to divide by.
+    candidates = np.stack((m[..., 0, 0], m[..., 1, 1], m[..., 2, 2], trace), axis=-1)
+    largest = np.argmax(candidates, axis=-1)
+    q = np.empty(m.shape[:-2] + (4,))
+
+    sel = largest == 3
+    s = 2 * np.sqrt(1 + trace[sel])
+    q[sel] = np.stack((m[sel][:, 2, 1] - m[sel][:, 1, 2],
+                       m[sel][:, 0, 2] - m[sel][:, 2, 0],
+                       m[sel][:, 1, 0] - m[sel][:, 0, 1],
+                       s * s / 4), axis=-1) / s[:, np.newaxis]
+    for i, j, k in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+        sel = largest == i
+        ms = m[sel]
+        s = 2 * np.sqrt(1 + ms[:, i, i] - ms[:, j, j] - ms[:, k, k])
+        part = np.empty((len(ms), 4))
+        part[:, i] = s / 4
+        part[:, j] = (ms[:, j, i] + ms[:, i, j]) / s
+        part[:, k] = (ms[:, k, i] + ms[:, i, k]) / s
+        part[:, 3] = (ms[:, k, j] - ms[:, j, k]) / s
+        q[sel] = part
+    q *= np.where(q[..., 3:4] < 0, -1.0, 1.0)
+    return q
+
+def pose_matrix(pose):
+    """ (..., 4, 4) homogeneous transforms of (..., 7) poses. """
+
+    pose = np.asarray(pose, dtype=float)
+    matrix = np.zeros(pose.shape[:-1] + (4, 4))
+    matrix[..., 0:3, 0:3] = quaternion_matrix(pose[..., 3:7])
+    matrix[..., 0:3, 3] = pose[..., 0:3]
+    matrix[..., 3, 3] = 1
+    return matrix
+
+def pose_from_matrix(matrix):
+    """ (..., 7) poses of (..., 4, 4) homogeneous transforms. """
+
+    matrix = np.asarray(matrix, dtype=float)
+    return np.concatenate((matrix[..., 0:3, 3], quaternion_from_matrix(matrix)),
+                          axis=-1)
+
+def compose(a, b):
+    """ Pose of b expressed through a, i.e. the transform a * b. """
+
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    qa = normalize(a[..., 3:7])
+    return np.concatenate((a[..., 0:3] + rotate(qa, b[..., 0:3]),
+                           quaternion_multiply(qa, normalize(b[..., 3:7]))),
+                          axis=-1)
+
+def invert(a):
+    """ Inverse transforms of (..., 7) poses. """
+
+    a = np.asarray(a, dtype=float)
+    q = quaternion_conjugate(normalize(a[..., 3:7]))
+    return np.concatenate((-rotate(q, a[..., 0:3]), q), axis=-1)
+
+def relative(a, b):
+    """ Transform from pose a to pose b, inverse(a) * b.  This is what an
+    EDGE_SE3:QUAT between two vertices measures. """
+
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    q = quaternion_conjugate(normalize(a[..., 3:7]))
+    return np.concatenate((rotate(q, b[..., 0:3] - a[..., 0:3]),
+                           quaternion_multiply(q, normalize(b[..., 3:7]))),
+                          axis=-1)
+
+def yaw(q):
+    """ Rotation about z, as returned by euler_from_quaternion(q)[2]. """
+
+    q = np.asarray(q, dtype=float)
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    return np.arctan2(2 * (w*z + x*y), w*w + x*x - y*y - z*z)
+
+def quaternion_from_euler(roll, pitch, yaw):
+    """ Same convention as tf.transformations.quaternion_from_euler with the
+    default static xyz axes; inputs may be arrays. """
+
+    roll, pitch, yaw = np.broadcast_arrays(np.asarray(roll, dtype=float) / 2,
+                                           np.asarray(pitch, dtype=float) / 2,
+                                           np.asarray(yaw, dtype=float) / 2)
+    cr, sr = np.cos(roll), np.sin(roll)
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    return np.stack((sr*cp*cy - cr*sp*sy,
+                     cr*sp*cy + sr*cp*sy,
+                     cr*cp*sy - sr*sp*cy,
+                     cr*cp*cy + sr*sp*sy), axis=-1)
+
+def slerp(q0, q1, fraction):
+    """ Spherical linear interpolation from (..., 4) unit quaternions q0 to
+    q1, fraction 0 giving q0 and 1 giving q1, along the shorter arc. """
+
+    q0 = normalize(q0)
+    q1 = normalize(q1)
+    fraction = np.asarray(fraction, dtype=float)[..., np.newaxis]
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    q1 = np.where(dot < 0, -q1, q1)
+    dot = np.clip(np.abs(dot), 0, 1)
+    angle = np.arccos(dot)
+    sin_angle = np.sin(angle)
+    #   Nearly equal rotations fall back to a normalized linear blend.
+    close = sin_angle < 1e-6
+    safe = np.where(close, 1, sin_angle)
+    w0 = np.where(close, 1 - fraction, np.sin((1 - fraction) * angle) / safe)
+    w1 = np.where(close, fraction, np.sin(fraction * angle) / safe)
+    return normalize(w0 * q0 + w1 * q1)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+import numpy as np
+import pyttsx
+
+HIGH = 0        # arrivals and warnings, spoken before anything else queued
+NORMAL = 1
+LOW = 2         # reminders that are fine to skip
+
+class SpeechQueue(object):
+    """ Speaks announcements on a worker thread, so saying something never
+    blocks a ROS callback or main loop.  Queued announcements are spoken
+    highest priority first, and in the order they were said within a priority.
+
+    An announcement with a key replaces the one with the same key that is
+    still waiting, e.g. a new direction replaces the one it supersedes.  One
+    with a max_age is dropped if it couldn't be started within max_age
+    seconds of being said.  stats() reports the delay from say() to the start
+    of speaking, over the last history announcements. """
+
+    def __init__(self, engine=None, history=1000):
+        self._engine = engine
+        self._condition = threading.Condition()
+        self._queue = []            # heap of (priority, order, announcement)
+        self._keyed = {}            # key -> the announcement waiting with it
+        self._order = itertools.count()
+        self._latencies = deque(maxlen=history)
+        self.spoken = 0
+        self.replaced = 0
+        self.expired = 0
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name="speech")
+        self._worker.daemon = True
+        self._worker.start()
+
+    def say(self, text, priority=NORMAL, key=None, max_age=None):
+        announcement = {'text': text, 'key': key, 'time': time.time(),
+                        'max_age': max_age, 'cancelled': False}
+        with self._condition:
+            if key is not None:
+                waiting = self._keyed.get(key)
+                if waiting is not None:
+                    waiting['cancelled'] = True
+                    self.replaced += 1
+                self._keyed[key] = announcement
+            heapq.heappush(self._queue, (priority, next(self._order), announcement))
+            self._condition.notify()
+
+    def cancel(self, key):
+        """ Drops the announcement waiting with key, if there is one. """
+
+        with self._condition:
+            waiting = self._keyed.pop(key, None)
+            if waiting is not None:
+                waiting['cancelled'] = True
+
+    def __len__(self):
+        with self._condition:
+            return sum(1 for _, _, announcement in self._queue
+                       if not announcement['cancelled'])
+
+    def stats(self):
+        """ Counts, and the say() to speaking latency in seconds. """
+
+        with self._condition:
+            latencies = np.array(self._latencies)
+            stats = {'spoken': self.spoken, 'replaced': self.replaced,
+                     'expired': self.expired}
+        if len(latencies):
+            stats.update(mean=float(latencies.mean()),
+                         median=float(np.median(latencies)),
+                         p95=float(np.percentile(latencies, 95)),
+                         max=float(latencies.max()))
+        return stats
+
+    def stop(self):
+        """ Stops the worker once it has finished the current announcement;
+        whatever is still queued is not spoken. """
+
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._worker.join()
+
+    def _next(self):
+        """ Waits for the next announcement to speak, or None on stop. """
+
+        with self._condition:
+            while True:
+                while self._running and not self._queue:
+                    self._condition.wait()
+                if not self._running:
+                    return None
+                _, _, announcement = heapq.heappop(self._queue)
+                if announcement['cancelled']:
+                    continue
+                if self._keyed.get(announcement['key']) is announcement:
+                    del self._keyed[announcement['key']]
+                latency = time.time() - announcement['time']
+                if announcement['max_age'] is not None and latency > announcement['max_age']:
+                    self.expired += 1
+                    continue
+                self._latencies.append(latency)
+                self.spoken += 1
+                return announcement
+
+    def _run(self):
+        #   pyttsx engines aren't thread safe, so the engine is made and only
+        #   ever used on this thread.
+        if self._engine is None:
+            self._engine = pyttsx.init()
+        while True:
+            announcement = self._next()
+            if announcement is None:
+                break
+            self._engine.say(announcement['text'])
+            self._engine.runAndWait()
+
+if __name__ == "__main__":
+    speech = SpeechQueue()
+    speech.say("Starting up.")
+    for clock in range(1, 6):
+        speech.say("The next turn is at %i o'clock." % clock, LOW, key="direction")
+    speech.say("You have arrived.", HIGH, key="direction")
+    while len(speech):
+        time.sleep(0.1)
+    speech.stop()
+    print(speech.stats())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import threading
+import rospy
+import tf
+
+TF_EXCEPTIONS = (tf.ExtrapolationException,
+                 tf.LookupException,
+                 tf.ConnectivityException,
+                 tf.Exception,
+                 ValueError)
+
+class TransformRequestQueue(object):
+    """ Queue of tf lookups that are answered as soon as the listener's
+    buffer can answer them, instead of blocking a callback in
+    waitForTransform.
+
+    A request is a list of lookups, each either (target, source, stamp) as
+    for lookupTransform or (target, target_time, source, source_time, fixed)
+    as for lookupTransformFull.  Once every lookup of a request can be done,
+    callback is called with the list of (trans, rot) results in the same
+    order.  If that hasn't happened within the timeout, or a lookup raises,
+    on_failure is called with a message instead.  process() does the
+    checking; call it whenever new tf data may have arrived. """
+
+    def __init__(self, listener, timeout=rospy.Duration(.5)):
+        self.listener = listener
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pending = []      # (lookups, callback, on_failure, deadline)
+
+    def request(self, lookups, callback, on_failure=None, timeout=None):
+        deadline = rospy.Time.now() + (self.timeout if timeout is None else timeout)
+        with self._lock:
+            self._pending.append((list(lookups), callback, on_failure, deadline))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _ready(self, lookups):
+        for lookup in lookups:
+            if len(lookup) == 3:
+                if not self.listener.canTransform(*lookup):
+                    return False
+            elif not self.listener.canTransformFull(*lookup):
+                return False
+        return True
+
+    def _lookup(self, lookups):
+        results = []
+        for lookup in lookups:
+            if len(lookup) == 3:
+                results.append(self.listener.lookupTransform(*lookup))
+            else:
+                results.append(self.listener.lookupTransformFull(*lookup))
+        return results
+
+    def process(self):
+        """ Answers every request tf now has the data for and fails the ones
+        that have timed out.  Callbacks run on the calling thread, after the
+        queue's lock is released. """
+
+        now = rospy.Time.now()
+        finished = []
+        with self._lock:
+            waiting = []
+            for entry in self._pending:
+                lookups, callback, on_failure, deadline = entry
+                try:
+                    if self._ready(lookups):
+                        finished.append((callback, self._lookup(lookups)))
+                    elif now > deadline:
+                        finished.append((on_failure, "timed out waiting for %s" % (lookups,)))
+                    else:
+                        waiting.append(entry)
+                except TF_EXCEPTIONS as e:
+                    finished.append((on_failure, str(e)))
+            self._pending = waiting
+        for handler, result in finished:
+            if handler is not None:
+                handler(result)
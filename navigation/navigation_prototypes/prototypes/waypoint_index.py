@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+class WaypointIndex(object):
+    """ Named waypoints kept as an (N, 3) array with a KD-tree over them, for
+    radius and nearest-k lookups that don't scan every waypoint.  Behaves
+    like the {name: [x, y, z]} dict it replaces (setting, popping, iterating
+    over names), and the tree is rebuilt on the first query after a change. """
+
+    def __init__(self, waypoints=None):
+        self.names = []
+        self.points = np.zeros((0, 3))
+        self._tree = None
+        if waypoints:
+            self.load(waypoints)
+
+    def load(self, waypoints):
+        """ Replaces the contents with a {name: [x, y, z]} dict. """
+
+        self.names = list(waypoints.keys())
+        self.points = np.array([waypoints[name] for name in self.names],
+                               dtype=float).reshape(-1, 3)
+        self._tree = None
+
+    def as_dict(self):
+        """ {name: [x, y, z]}, the format waypoints are pickled in. """
+
+        return dict((name, point.tolist()) for name, point in zip(self.names, self.points))
+
+    def __setitem__(self, name, location):
+        if name in self.names:
+            self.points[self.names.index(name)] = location
+        else:
+            self.names.append(name)
+            self.points = np.vstack((self.points, np.asarray(location, dtype=float)[np.newaxis]))
+        self._tree = None
+
+    def __getitem__(self, name):
+        return self.points[self.names.index(name)].tolist()
+
+    def pop(self, name, default=None):
+        if name not in self.names:
+            return default
+        row = self.names.index(name)
+        location = self.points[row].tolist()
+        del self.names[row]
+        self.points = np.delete(self.points, row, axis=0)
+        self._tree = None
+        return location
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(list(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def items(self):
+        return list(zip(self.names, self.points.tolist()))
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+    def _index(self):
+        if self._tree is None and len(self.names):
+            self._tree = cKDTree(self.points)
+        return self._tree
+
+    def within(self, position, radius, z_scale=1):
+        """ (name, distance) of every waypoint closer than radius to position,
+        nearest first.  z_scale stretches height differences, e.g. 2 to make
+        a floor change count for more than the same distance on the floor. """
+
+        tree = self._index()
+        if tree is None:
+            return []
+        position = np.asarray(position, dtype=float)
+        #   Stretching z only makes distances longer, so the plain ball holds
+        #   every candidate and the scaled distance is checked afterwards.
+        rows = np.asarray(tree.query_ball_point(position, radius), dtype=np.int64)
+        distances = self._distances(rows, position, z_scale)
+        keep = distances < radius
+        rows, distances = rows[keep], distances[keep]
+        order = np.argsort(distances, kind="mergesort")
+        return [(self.names[row], distance) for row, distance
+                in zip(rows[order].tolist(), distances[order].tolist())]
+
+    def nearest(self, position, k=1, z_scale=1):
+        """ (name, distance) of the k waypoints closest to position. """
+
+        tree = self._index()
+        if tree is None:
+            return []
+        position = np.asarray(position, dtype=float)
+        if z_scale == 1:
+            distances, rows = tree.query(position, k=min(k, len(self.names)))
+            return [(self.names[row], distance) for row, distance
+                    in zip(np.atleast_1d(rows).tolist(), np.atleast_1d(distances).tolist())]
+        distances = self._distances(np.arange(len(self.names)), position, z_scale)
+        order = np.argsort(distances, kind="mergesort")[:k]
+        return [(self.names[row], distances[row]) for row in order.tolist()]
+
+    def _distances(self, rows, position, z_scale):
+        offsets = self.points[rows] - position
+        offsets[:, 2] *= z_scale
+        return np.sqrt(np.sum(offsets * offsets, axis=1))
+
+if __name__ == "__main__":
+    import time
+    rng = np.random.RandomState(0)
+    index = WaypointIndex(dict(("waypoint_%i" % i, point) for i, point
+                               in enumerate((rng.rand(500, 3) * [100, 100, 12]).tolist())))
+    positions = rng.rand(10000, 3) * [100, 100, 12]
+    start = time.time()
+    for position in positions:
+        index.within(position, 1.8)
+    print("%i radius queries over %i waypoints: %.1f us each"
+          % (len(positions), len(index), 1e6 * (time.time() - start) / len(positions)))
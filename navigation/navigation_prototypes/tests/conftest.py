@@ -0,0 +1,7 @@
+import os
+import sys
+
+#   The prototypes are flat modules imported as siblings, as the nodes do.
+PACKAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(PACKAGE, "prototypes"))
+sys.path.insert(0, PACKAGE)
@@ -0,0 +1,42 @@
+import io
+import json
+import numpy as np
+from dynamodb_stream import iter_items, iter_runs
+
+class Trickle(object):
+    """ Stream handing out at most size bytes per read, like a slow socket. """
+
+    def __init__(self, data, size):
+        self.data = io.BytesIO(data)
+        self.size = size
+
+    def read(self, size=-1):
+        return self.data.read(self.size if size is None or size < 0 else min(size, self.size))
+
+def response(path_ids):
+    items = [{u'PathID': {u'S': path_id},
+              u'navigationDataTime': {u'L': [{u'N': str(i + 0.5)} for i in range(4)]}}
+             for path_id in path_ids]
+    return json.dumps({u'Items': items, u'Count': len(items)}).encode('utf-8')
+
+def test_path_id_split_across_reads():
+    path_ids = [u"run%02i-1" % i for i in range(5)]
+    data = response(path_ids)
+    #   Every split of the first PathID between two reads.
+    for chunk_size in range(1, 40):
+        items = list(iter_items(Trickle(data, chunk_size), u"run03", chunk_size))
+        assert [item[u'PathID'][u'S'] for item in items] == [u"run03-1"]
+        assert np.array_equal(items[0][u'navigationDataTime'][u'L'], [0.5, 1.5, 2.5, 3.5])
+
+def test_filter_reads_each_item_own_path_id():
+    #   The first item has no PathID, so a search of the text from where it
+    #   starts would find the second item's.
+    text = json.dumps({u'Items': [
+        {u'navigationDataTime': {u'L': [{u'N': u"1"}]}},
+        {u'PathID': {u'S': u"B-1"}}]})
+    assert [item[u'PathID'][u'S'] for item in iter_items(io.StringIO(text), u"B")] == [u"B-1"]
+    assert len(list(iter_items(io.StringIO(text)))) == 2
+
+def test_runs_group_consecutive_items():
+    data = response([u"a-1", u"a-2", u"b-1", u"c-1", u"c-2"])
+    assert [len(run) for run in iter_runs(io.BytesIO(data))] == [2, 1, 2]
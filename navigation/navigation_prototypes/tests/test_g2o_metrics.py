@@ -0,0 +1,23 @@
+import os
+import numpy as np
+from g2o_graph import load_g2o
+from g2o_metrics import edge_corrections
+
+SAVED = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "NavData", "savedwaypoints")
+
+def test_edge_corrections_skip_orientation_dummies():
+    #   Every pose of PunchlinePlot has a FIXed dummy at id + 1, so odometry
+    #   runs id -> id + 2.
+    graph = load_g2o(os.path.join(SAVED, "PunchlinePlot", "result.g2o"), cache=False)
+    corrections = edge_corrections(graph)
+    assert len(corrections['from_ids']) > 1000
+    assert np.all(corrections['to_ids'] - corrections['from_ids'] == 2)
+    assert not np.any(np.isin(corrections['to_ids'], graph.fixed_ids))
+    assert corrections['translation'].mean() < 0.01
+    assert corrections['translation'].max() < 1.0
+
+def test_edge_corrections_without_dummies():
+    graph = load_g2o(os.path.join(SAVED, "g2o_testing_3", "result.g2o"), cache=False)
+    corrections = edge_corrections(graph)
+    assert np.all(corrections['to_ids'] - corrections['from_ids'] == 1)
+    assert corrections['translation'].mean() < 0.01
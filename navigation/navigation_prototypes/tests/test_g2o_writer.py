@@ -0,0 +1,36 @@
+import pytest
+from g2o_graph import load_g2o
+from g2o_writer import G2OWriter
+
+class FullDisk(object):
+    """ File whose writes fail, as on a full disk. """
+
+    def __init__(self, real):
+        self.real = real
+
+    def write(self, text):
+        raise IOError(28, "No space left on device")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.real.close()
+
+def test_close_writes_everything(tmpdir):
+    path = str(tmpdir.join("data.g2o"))
+    writer = G2OWriter(path, batch_size=4)
+    for vertex_id in range(10):
+        writer.add_vertex(vertex_id, (vertex_id, 0, 0), (0, 0, 0, 1))
+    writer.close()
+    writer.close()
+    assert list(load_g2o(path, cache=False).vertex_ids) == list(range(10))
+
+def test_close_raises_a_failed_last_write(tmpdir):
+    writer = G2OWriter(str(tmpdir.join("data.g2o")))
+    writer._file = FullDisk(writer._file)
+    writer.add_vertex(587, (0, 0, 0), (0, 0, 0, 1))
+    with pytest.raises(IOError):
+        writer.close()
+    #   The error is raised once.
+    writer.close()
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+#   json_parsing is a python 2 script (urllib2) that also needs matplotlib.
+pytest.importorskip("urllib2")
+pytest.importorskip("matplotlib")
+import json_parsing
+
+def shuffled_run(count=500, seed=0):
+    """ A run whose navigation times are out of order, as runs split over
+    several items can be. """
+
+    rng = np.random.RandomState(seed)
+    times = rng.permutation(np.cumsum(0.05 + 0.1 * rng.rand(count)))
+    navigation = rng.randn(count, 16)
+    return json_parsing.PathRun.from_arrays({
+        'navigation': navigation, 'navigation_times': times, 'path': np.zeros((0, 16)),
+        'keypoints': np.zeros((0, 3)), 'speech_text': np.array([], dtype='U'),
+        'speech_times': np.zeros(0)}, "run")
+
+def test_align_times_matches_brute_force_search():
+    run = shuffled_run()
+    rng = np.random.RandomState(1)
+    times = rng.uniform(run.navigation_times.min() - 1, run.navigation_times.max() + 1, 300)
+    aligned = json_parsing.align_times(run, times)
+    gaps = np.abs(times[:, np.newaxis] - run.navigation_times[np.newaxis, :])
+    brute = np.argmin(gaps, axis=1)
+    assert np.array_equal(aligned['indices'], brute)
+    assert np.allclose(aligned['offsets'], times - run.navigation_times[brute])
+    assert np.array_equal(aligned['positions'], run.navigation[brute, 12:15])
+
+def test_nearest_nav_point_of_a_navigation_time():
+    run = shuffled_run(50)
+    for index in (0, 17, 49):
+        assert json_parsing.nearest_nav_point(run, run.navigation_times[index]) == index
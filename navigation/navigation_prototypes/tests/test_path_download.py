@@ -0,0 +1,43 @@
+import json
+from path_download import Downloader, StandinServer
+from path_store import PathStore
+
+PHONE = "09F2D016-33E8-4FCC-838A-220B8B151328"
+
+def numbers(values):
+    return {u'L': [{u'N': repr(float(value))} for value in values]}
+
+def response(runs):
+    items = [{u'PathID': {u'S': PHONE + u"2017-07-%02iT10:00-1" % day},
+              u'PathDate': {u'S': u"2017-07-%02iT10:00:00" % day},
+              u'navigationData': {u'L': [numbers(range(16)) for _ in range(3)]},
+              u'navigationDataTime': numbers([0.0, 0.1, 0.2])}
+             for day in range(1, runs + 1)]
+    return json.dumps({u'Items': items, u'Count': len(items)})
+
+def test_download_against_standin(tmpdir):
+    recorded = tmpdir.mkdir("recorded")
+    recorded.join("u1.json").write(response(2))
+    recorded.join("bad.json").write(response(2)[:150])
+    server = StandinServer(str(recorded), failures={'u1': 2}).start()
+    try:
+        store = PathStore(str(tmpdir.join("store")))
+        results = Downloader(store, server.url, threads=2, retries=3, backoff=0.01).download(['u1', 'bad'])
+        #   u1 is asked again after each injected 503.
+        assert results['u1']['status'] == 200 and results['u1']['attempts'] == 3
+        assert results['u1']['runs'] == 2
+        #   The truncated body fails bad alone, after every retry.
+        assert results['bad']['error'].startswith("bad response")
+        assert results['bad']['attempts'] == 4
+        assert len(store.runs(user_id='u1')) == 2 and not store.runs(user_id='bad')
+
+        #   Downloaded again, u1 is revalidated with its ETag and unchanged.
+        del server.requests[:]
+        results = Downloader(PathStore(str(tmpdir.join("store"))), server.url, threads=2,
+                             retries=0).download(['u1'])
+        assert results['u1']['status'] == 304
+        path, headers = server.requests[0]
+        assert path.endswith("/u1")
+        assert 'if-none-match' in [name.lower() for name in headers]
+    finally:
+        server.stop()
@@ -0,0 +1,32 @@
+import numpy as np
+from path_simplification import OnlineSimplifier, line_distances, random_walk, simplify
+
+def test_simplify_keeps_every_point_within_tolerance():
+    path = random_walk(5000)
+    for tolerance in (0.1, 0.7, 1.5):
+        keep = simplify(path, tolerance)
+        assert keep[0] == 0 and keep[-1] == len(path) - 1
+        assert np.all(np.diff(keep) > 0)
+        for start, end in zip(keep[:-1], keep[1:]):
+            assert line_distances(path, start, end).max() <= tolerance
+
+def test_online_keypoints_keep_every_point_within_tolerance():
+    path = random_walk(5000)
+    online = OnlineSimplifier(0.7)
+    for point in path:
+        online.add(point)
+    keypoints = online.keypoints()
+    #   Keypoints are points of the path, ending with the newest.
+    keep = [int(np.flatnonzero(np.all(path == keypoint, axis=1))[0]) for keypoint in keypoints]
+    assert keep[0] == 0 and keep[-1] == len(path) - 1
+    assert np.all(np.diff(keep) > 0)
+    for start, end in zip(keep[:-1], keep[1:]):
+        assert line_distances(path, start, end).max() <= 0.7
+
+def test_simplify_drops_points_on_a_line():
+    line = np.column_stack((np.arange(100.0), np.zeros(100), np.zeros(100)))
+    assert list(simplify(line, 0.01)) == [0, 99]
+
+def test_simplify_short_paths():
+    assert list(simplify(np.zeros((0, 3)), 1)) == []
+    assert list(simplify(np.ones((2, 3)), 1)) == [0, 1]
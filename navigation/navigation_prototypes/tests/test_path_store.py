@@ -0,0 +1,57 @@
+import json
+import numpy as np
+from dynamodb_stream import read_run
+from path_store import PathStore, decode_items
+
+PHONE = "09F2D016-33E8-4FCC-838A-220B8B151328"
+
+def numbers(values):
+    return {u'L': [{u'N': repr(float(value))} for value in values]}
+
+def item(path_id, date, poses, seed):
+    rng = np.random.RandomState(seed)
+    return {u'PathID': {u'S': path_id}, u'PathDate': {u'S': date},
+            u'navigationData': {u'L': [numbers(row) for row in rng.randn(poses, 16)]},
+            u'navigationDataTime': numbers(np.arange(poses) * 0.1),
+            u'PathData': {u'L': [numbers(row) for row in rng.randn(3, 16)]},
+            u'keypointData': {u'L': [numbers(row) for row in rng.randn(2, 3)]},
+            u'speechData': {u'L': [{u'S': u"turn %i" % seed}]},
+            u'speechDataTime': numbers([seed])}
+
+def dump():
+    """ Three runs, the first split over two items, out of date order. """
+
+    return {u'Count': 4, u'Items': [
+        item(PHONE + u"2017-07-03T09:30-1", u"2017-07-03T09:30:00", 20, 0),
+        item(PHONE + u"2017-07-03T09:30-2", u"2017-07-03T09:30:00", 10, 1),
+        item(PHONE + u"2017-07-01T10:00-1", u"0", 5, 2),
+        item(PHONE + u"2017-07-02T08:15-1", u"2017-07-02T08:15:00", 8, 3)]}
+
+def test_import_and_load_round_trip(tmpdir):
+    response = dump()
+    store = PathStore(str(tmpdir))
+    path_ids = store.import_dump(response)
+    assert len(path_ids) == 3
+    #   Opened again, the store reads the index from disk.
+    store = PathStore(str(tmpdir))
+    assert len(store) == 3
+    arrays = store.load(PHONE + u"2017-07-03T09:30-1")
+    expected = decode_items(response[u'Items'][0:2])
+    for name in expected:
+        assert np.array_equal(arrays[name], expected[name]), name
+    assert arrays['navigation'].shape == (30, 16)
+
+def test_runs_in_the_order_read_run_counts(tmpdir):
+    response = dump()
+    path = tmpdir.join("response.json")
+    path.write(json.dumps(response))
+    store = PathStore(str(tmpdir.join("store")))
+    store.import_dump(str(path))
+    runs = store.runs()
+    assert [entry['date'] for _, entry in runs] == ["2017-07-01T10:00", "2017-07-02T08:15:00",
+                                                    "2017-07-03T09:30:00"]
+    for index in (1, 2, 3):
+        with open(str(path), 'rb') as response_file:
+            items = read_run(response_file, index=index)
+        assert items[0][u'PathID'][u'S'] == runs[-index][0]
+    assert store.runs(date="2017-07-02")[0][1]['poses'] == 8
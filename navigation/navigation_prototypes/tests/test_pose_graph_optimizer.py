@@ -0,0 +1,35 @@
+import numpy as np
+import se3
+from g2o_graph import G2OGraph
+from pose_graph_optimizer import PoseGraphOptimizer
+
+def square_loop(seed=0):
+    """ Eight poses walking around a square with odometry edges and one loop
+    closure, whose vertices start from a perturbed copy of the truth. """
+
+    headings = np.repeat(np.arange(4) * np.pi / 2, 2)
+    rotations = se3.quaternion_from_euler(0, 0, headings)
+    corners = np.array([[0, 0], [1, 0], [2, 0], [2, 1], [2, 2], [1, 2], [0, 2], [0, 1]], dtype=float)
+    truth = np.hstack((corners, np.zeros((8, 1)), rotations))
+    edge_ids = np.array([[i, (i + 1) % 8] for i in range(8)])
+    measurements = se3.relative(truth[edge_ids[:, 0]], truth[edge_ids[:, 1]])
+    information = np.zeros((8, 21))
+    information[:, (0, 6, 11, 15, 18, 20)] = 100
+    rng = np.random.RandomState(seed)
+    noisy = truth.copy()
+    noisy[1:, 0:3] += 0.2 * rng.randn(7, 3)
+    noisy[1:, 3:7] = se3.normalize(noisy[1:, 3:7] + 0.05 * rng.randn(7, 4))
+    graph = G2OGraph(np.arange(8), noisy[:, 0:3], noisy[:, 3:7], edge_ids, measurements,
+                     information, np.array([0]))
+    return graph, truth
+
+def test_optimize_recovers_perturbed_loop():
+    graph, truth = square_loop()
+    optimizer = PoseGraphOptimizer(graph)
+    before = optimizer.chi2()
+    optimizer.optimize()
+    after = optimizer.chi2()
+    assert after < 1e-6 * before
+    assert np.allclose(optimizer.poses[:, 0:3], truth[:, 0:3], atol=1e-4)
+    #   The FIXed vertex stays where it was.
+    assert np.array_equal(optimizer.poses[0], graph.poses[0])
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+import se3
+from pose_history import PoseHistory
+
+def history(count=20, seed=0):
+    rng = np.random.RandomState(seed)
+    stamps = np.cumsum(0.05 + rng.rand(count) * 0.1)
+    poses = np.hstack((np.cumsum(rng.randn(count, 3), axis=0), se3.normalize(rng.randn(count, 4))))
+    return PoseHistory.from_arrays(stamps, poses), stamps, poses
+
+def test_interpolate_at_sample_times_gives_the_samples():
+    samples, stamps, poses = history()
+    found = samples.interpolate(stamps)
+    assert np.allclose(found[:, 0:3], poses[:, 0:3])
+    assert np.allclose(np.abs(np.sum(found[:, 3:7] * poses[:, 3:7], axis=1)), 1)
+
+def test_interpolate_between_samples_is_linear_in_translation():
+    samples, stamps, poses = history()
+    middle = (stamps[:-1] + stamps[1:]) / 2
+    assert np.allclose(samples.interpolate(middle)[:, 0:3], (poses[:-1, 0:3] + poses[1:, 0:3]) / 2)
+
+def test_interpolate_refuses_to_extrapolate():
+    samples, stamps, _ = history()
+    with pytest.raises(ValueError):
+        samples.interpolate(stamps[-1] + 1)
+    with pytest.raises(ValueError):
+        samples.interpolate(stamps[0] - 1)
@@ -0,0 +1,42 @@
+import numpy as np
+import se3
+
+def random_poses(count, seed=0):
+    rng = np.random.RandomState(seed)
+    return np.hstack((rng.randn(count, 3), se3.normalize(rng.randn(count, 4))))
+
+def assert_same_poses(a, b):
+    #   q and -q are the same rotation.
+    assert np.allclose(a[..., 0:3], b[..., 0:3])
+    dots = np.abs(np.sum(se3.normalize(a[..., 3:7]) * se3.normalize(b[..., 3:7]), axis=-1))
+    assert np.allclose(dots, 1)
+
+def test_compose_with_inverse_is_identity():
+    poses = random_poses(50)
+    identity = np.tile([0, 0, 0, 0, 0, 0, 1.0], (50, 1))
+    assert_same_poses(se3.compose(poses, se3.invert(poses)), identity)
+    assert_same_poses(se3.compose(se3.invert(poses), poses), identity)
+
+def test_relative_round_trips_through_compose():
+    a, b = random_poses(50, 1), random_poses(50, 2)
+    assert_same_poses(se3.compose(a, se3.relative(a, b)), b)
+    assert_same_poses(se3.invert(se3.invert(a)), a)
+
+def test_compose_matches_matrices():
+    a, b = random_poses(20, 3), random_poses(20, 4)
+    product = np.matmul(se3.pose_matrix(a), se3.pose_matrix(b))
+    assert_same_poses(se3.pose_from_matrix(product), se3.compose(a, b))
+
+def test_slerp_endpoints_and_midpoint():
+    q0 = random_poses(30, 5)[:, 3:7]
+    q1 = random_poses(30, 6)[:, 3:7]
+    assert np.allclose(se3.slerp(q0, q1, 0), q0)
+    ends = se3.slerp(q0, q1, 1)
+    assert np.allclose(np.abs(np.sum(ends * q1, axis=1)), 1)
+    #   Halfway is as far from either end.
+    middle = se3.slerp(q0, q1, 0.5)
+    assert np.allclose(np.abs(np.sum(middle * q0, axis=1)), np.abs(np.sum(middle * q1, axis=1)))
+
+def test_slerp_of_equal_rotations():
+    q = random_poses(5, 7)[:, 3:7]
+    assert np.allclose(se3.slerp(q, q, 0.3), q)